@@ -2,6 +2,17 @@ import os
 
 from flask import Flask, current_app, send_from_directory, make_response, render_template, redirect, request
 
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def send_static_file(directory: str, filename: str):
+    """바뀌지 않는 정적 파일(글꼴, 소리, 스크립트 등)을 오래 캐시하도록 보낸다"""
+    resp = make_response(send_from_directory(
+        os.path.join(current_app.root_path, "static", directory), filename, max_age=STATIC_MAX_AGE
+    ))
+    resp.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+    return resp
+
 
 def create_app() -> Flask:
     app = Flask(__name__, instance_relative_config=True, static_url_path='', static_folder='frontend/web')
@@ -12,6 +23,9 @@ def create_app() -> Flask:
     else:
         app.config.from_object("config.ProductionConfig")
 
+    from StudyRoomManagementServer.util import json_provider
+    json_provider.init_app(app)
+
     try:
         from flask_cors import CORS
         CORS(app, resources={"*": {"origins": "*"}})
@@ -41,15 +55,36 @@ def create_app() -> Flask:
     with app.app_context():
         model.db.create_all()
 
+    from StudyRoomManagementServer.util import num_index
+    num_index.init_app(app)
+
     from StudyRoomManagementServer.util import sms
     sms.init_app(app=app)
 
+    from StudyRoomManagementServer.util import qr_code
+    qr_code.init_app(app)
+
+    from StudyRoomManagementServer.util import user_cache
+    user_cache.init_app(app)
+
+    from StudyRoomManagementServer.util import table_version
+    table_version.init_app(app)
+
+    from StudyRoomManagementServer.util import otp
+    otp.init_app(app)
+
+    from StudyRoomManagementServer.util import log_writer
+    log_writer.init_app(app)
+
     from StudyRoomManagementServer.util import qr_img
     qr_img.init_app(app)
 
     from StudyRoomManagementServer.util import receipt
     receipt.init_app(app)
 
+    from StudyRoomManagementServer.util import membership_print
+    membership_print.init_app(app)
+
     if app.debug:
         from . import debug
         app.register_blueprint(debug.bp)
@@ -123,27 +158,28 @@ def create_app() -> Flask:
 
     @app.route("/sound/success")
     def serve_sound_success():
-        return make_response(send_from_directory(os.path.join(app.root_path, "static", "sound"), 'qr-success.wav'))
+        return send_static_file("sound", 'qr-success.wav')
 
     @app.route("/sound/fail")
     def serve_sound_fail():
-        return make_response(send_from_directory(os.path.join(app.root_path, "static", "sound"), 'qr-fail.wav'))
+        return send_static_file("sound", 'qr-fail.wav')
 
     @app.route("/img/coupon/main.png")
     def serve_image_coupon_main():
-        return make_response(send_from_directory(os.path.join(app.root_path, "static", "img"), 'coupon_main.png'))
+        return send_static_file("img", 'coupon_main.png')
 
     @app.route("/js/html5-qrcode")
     def serve_html5_qrcode():
-        return make_response(send_from_directory(os.path.join(app.root_path, "static", "js"), 'html5-qrcode.min.js'))
+        return send_static_file("js", 'html5-qrcode.min.js')
 
     @app.route("/font/<path:filename>")
     def serve_font(filename):
-        return make_response(send_from_directory(os.path.join(app.root_path, "static", "font"), filename))
+        return send_static_file("font", filename)
 
     from . import __version__
 
     @app.route("/api/info")
+    @table_version.versioned_etag(extra=lambda: str(bool(request.cookies.get("Authorization"))), vary="Cookie")
     def get_server_info():
         return {
             "title": __version__.__title__,
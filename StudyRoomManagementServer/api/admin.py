@@ -1,10 +1,23 @@
+import os
+
 from flask import (
     Blueprint,
+    request,
+    current_app,
 )
 
+from StudyRoomManagementServer.auth_decorator import check_user_from_cookie_authorization
+from StudyRoomManagementServer.controller.users import get_or_create_qrs
+from StudyRoomManagementServer.util import membership_print
+from StudyRoomManagementServer.util.qr_code import create_qr_code
+from StudyRoomManagementServer.util.utils import send_spool_file
+from StudyRoomManagementServer.util.qr_img import get_membership_asset, get_asset_kind, get_font_path, \
+    ASSET_NORMAL, ASSET_VIP
 from .lib import user as checker
 from ..model import User, db
 
+MEMBERSHIP_JOB_WORKERS = 4
+
 bp = Blueprint("admin", __name__, url_prefix="/api/admin")
 
 
@@ -45,3 +58,71 @@ def create_dummy_user():
         db.session.commit()
 
     return dummy_user.publics_to_dict()
+
+
+@bp.route("/membership-cards", methods=("POST",))
+@check_user_from_cookie_authorization
+def post_membership_cards():
+    """회원권 일괄 생성 작업을 시작한다(grade, department, start_date, end_date 로 대상을 거른다)"""
+    output = request.values.get("output", default=membership_print.OUTPUT_A4, type=str)
+    if output not in (membership_print.OUTPUT_A4, membership_print.OUTPUT_ZIP):
+        return {"message": "올바르지 않은 출력 형식입니다."}, 400
+
+    q = User.query.filter(User.sms == 1)
+
+    grades = request.values.getlist("grade", type=int)
+    if grades:
+        q = q.filter(User.grade.in_(grades))
+
+    department = request.values.get("department", type=str)
+    if department:
+        q = q.filter_by(department=department)
+
+    start_date = request.values.get("start_date", type=str)
+    if start_date:
+        q = q.filter(db.func.date(User.created) >= start_date)
+
+    end_date = request.values.get("end_date", type=str)
+    if end_date:
+        q = q.filter(db.func.date(User.created) <= end_date)
+
+    users = q.order_by(User.id).all()
+    if not users:
+        return {"message": "대상 회원이 없습니다."}, 404
+
+    qrs = get_or_create_qrs(users)
+
+    assets = {kind: get_membership_asset(kind) for kind in (ASSET_NORMAL, ASSET_VIP,)}
+    cards = []
+    for user in users:
+        qr = qrs[user.id]
+        asset = assets[get_asset_kind(user)]
+        cards.append(membership_print.Card(
+            user.id, qr.revision, qr.skey, asset.path, tuple(asset.qr_box), tuple(asset.text_location),
+            create_qr_code(user, qr),
+        ))
+
+    workers = current_app.config.get("MEMBERSHIP_JOB_WORKERS", MEMBERSHIP_JOB_WORKERS)
+    status = membership_print.start_job(cards, output, get_font_path(), workers)
+    return {"message": "ok", "job": status}, 202
+
+
+@bp.route("/membership-cards/<string:job_id>", methods=("GET",))
+@check_user_from_cookie_authorization
+def get_membership_cards_job(job_id: str):
+    status = membership_print.get_job_status(job_id)
+    if status is None:
+        return {"message": "해당 작업이 없습니다."}, 404
+
+    return {"message": "ok", "job": status}
+
+
+@bp.route("/membership-cards/<string:job_id>/download", methods=("GET",))
+@check_user_from_cookie_authorization
+def get_membership_cards_file(job_id: str):
+    file_path = membership_print.get_job_output_path(job_id)
+    if file_path is None:
+        return {"message": "완료된 작업이 없습니다."}, 404
+
+    mimetype = "application/pdf" if file_path.endswith(".pdf") else "application/zip"
+    return send_spool_file(file_path, mimetype, download_name=os.path.basename(file_path))
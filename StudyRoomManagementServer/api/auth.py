@@ -1,6 +1,4 @@
 import datetime as dt
-from random import choice
-from string import digits
 from typing import Optional, Union, Dict, Tuple
 
 import pytz
@@ -17,19 +15,18 @@ from StudyRoomManagementServer.auth_decorator import (
 )
 from StudyRoomManagementServer.constants import Grade
 from StudyRoomManagementServer.model import User, db
-from StudyRoomManagementServer.util.qr_code import get_user_from_qr_code
+from StudyRoomManagementServer.util.qr_code import get_user_from_qr_code, get_users_from_qr_codes
 from StudyRoomManagementServer.util.utils import create_log
 from StudyRoomManagementServer.util.utils import get_grade_color, tz_conv
 from .lib.user import (
     generate_new_sms_code
 )
 from .. import access
-from ..util import sms
+from ..util import sms, log_writer
+from ..util.otp import OTP_LENGTH, get_new_otp, issue_otp, consume_otp
 
 bp = Blueprint("auth", __name__, url_prefix="/api/auth")
-otp_storage = {}
 
-OTP_LENGTH = 6
 OTP_ERROR_BAD_REQUEST = -400
 OTP_ERROR_FORBIDDEN = -403
 OTP_ERROR_NOT_FOUND = -404
@@ -41,11 +38,9 @@ OTP_ERROR_CODE_RESPONSE = {
     OTP_ERROR_TIMEOUT: ({"status": "reject", "message": "OTP 이용 시간 초과(10분 이내로 인증하세요)"}, 403),
 }
 QR_LAST_UPDATE_DATETIME = dt.datetime(2021, 3, 31, 18, 0, 0, 0, pytz.timezone("Asia/Seoul"))
-
-
-def get_new_otp() -> str:
-    new_otp = "".join([choice(digits) for _ in range(OTP_LENGTH)])
-    return new_otp
+QR_BATCH_MAX = 200
+QR_BATCH_MAX_AGE = dt.timedelta(hours=24)
+QR_BATCH_MAX_SKEW = dt.timedelta(minutes=1)
 
 
 def _check_otp_code_in_storage(request_otp_code: str) -> int:
@@ -56,18 +51,14 @@ def _check_otp_code_in_storage(request_otp_code: str) -> int:
     elif len(request_otp_code) != OTP_LENGTH:
         return OTP_ERROR_BAD_REQUEST
 
-    otp_set = set([v["otp_code"] for v in otp_storage.values()])
-
-    if request_otp_code not in otp_set:
+    result = consume_otp(request_otp_code)
+    if result is None:
         return OTP_ERROR_NOT_FOUND
 
-    user_id, created = [(k, v["created"],) for k, v in otp_storage.items() if v["otp_code"] == request_otp_code][0]
-    del otp_storage[user_id]
-
-    if (created + dt.timedelta(minutes=10)) <= dt.datetime.utcnow():
+    elif result.expired:
         return OTP_ERROR_TIMEOUT
 
-    return user_id
+    return result.user_id
 
 
 def _check_otp_request() -> Union[Tuple[Dict[str, str], int], User]:
@@ -116,14 +107,10 @@ def get_otp():
 
     elif check_config_authorization(auth["username"], auth["password"]):
         user = User.query.filter_by(id=1).first()
-        otp_storage[user.id] = {
-            "otp_code": get_new_otp(),
-            "created": dt.datetime.utcnow(),
-        }
         return {
             "status": "confirm",
             "message": "OTP 발급 성공",
-            "otp": otp_storage[user.id]["otp_code"],
+            "otp": issue_otp(user.id),
         }
 
     return {
@@ -174,7 +161,7 @@ def post_bot():
 @bp.route("/test", methods=["GET"])
 def get_test():
     print("api.auth.test")
-    return get_user_from_cookie_authorization().publics_to_dict()
+    return get_user_from_cookie_authorization().publics_to_dict(with_num=True)
 
 
 @bp.route("/otp/request", methods=["POST"])
@@ -187,14 +174,10 @@ def post_otp_request(user: User):
     elif user.grade < 15:
         return {"status": "reject", "message": "권한이 없습니다."}, 403
 
-    otp_storage[user.id] = {
-        "otp_code": get_new_otp(),
-        "created": dt.datetime.utcnow(),
-    }
     return {
         "status": "confirm",
         "message": "OTP 발급 성공",
-        "otp": otp_storage[user.id]["otp_code"],
+        "otp": issue_otp(user.id),
     }
 
 
@@ -242,7 +225,8 @@ def post_sms_response():
     if "user_id" not in data:
         return {"status": "reject", "message": "user_id 가 없습니다."}, 400
 
-    user: Optional[User] = User.query.filter_by(id=data["user_id"]).first()
+    # 인증 과정에서 캐시로 읽은 사용자일 수 있으므로 SMS 코드는 DB 값으로 확인한다
+    user: Optional[User] = User.query.filter_by(id=data["user_id"]).populate_existing().first()
     if not user:
         return {"status": "reject", "message": "사용자가 없습니다."}, 404
 
@@ -276,12 +260,10 @@ def post_sms_response():
 def post_qr_authorization(user: User):
     print("api.auth.post_qr_authorization")
     if not user.valid:
-        db.session.add(create_log(user, None, log_type="auth", extra_data={"success": False}))
-        db.session.commit()
+        log_writer.add_log(create_log(user, None, log_type="auth", extra_data={"success": False}), dedupe=True)
         return {"status": "reject", "message": "인증되지 않았습니다."}, 403
 
-    db.session.add(create_log(user, None, log_type="auth", extra_data={"success": True}))
-    db.session.commit()
+    log_writer.add_log(create_log(user, None, log_type="auth", extra_data={"success": True}), dedupe=True)
     return {"status": "confirm", "message": "인증되었습니다."}
 
 
@@ -290,16 +272,14 @@ def post_qr_authorization(user: User):
 def post_qr_authorization_enter(user: User):
     print("api.auth.post_qr_authorization_enter")
     if not user.valid:
-        db.session.add(create_log(user, None, log_type="auth", extra_data={"success": False}))
-        db.session.commit()
+        log_writer.add_log(create_log(user, None, log_type="auth", extra_data={"success": False}), dedupe=True)
         return {"status": "reject", "message": "인증되지 않았습니다."}, 403
 
     result = user.publics_to_dict()
     result["name"] = user.username
     result["gradeClass"] = "text-" + get_grade_color(user.grade)
 
-    db.session.add(create_log(user, None, log_type="auth", extra_data={"success": True}))
-    db.session.commit()
+    log_writer.add_log(create_log(user, None, log_type="auth", extra_data={"success": True}), dedupe=True)
     result["status"] = "confirm"
     result["message"] = "인증되었습니다."
     return result
@@ -317,6 +297,84 @@ def get_otp_code(chat_id: int):
         return {"code": None}, 401
 
 
+def _parse_scanned_at(value: Union[str, int, float, None]) -> dt.datetime:
+    """스캔 시간(ISO 8601 또는 epoch 밀리초)을 UTC 로 바꾼다
+
+    서버 시간보다 QR_BATCH_MAX_SKEW 넘게 미래이거나 QR_BATCH_MAX_AGE 넘게 지난 시간은 ValueError.
+    """
+    if value is None:
+        return dt.datetime.utcnow()
+
+    if isinstance(value, (int, float)):
+        scanned_at = dt.datetime.utcfromtimestamp(value / 1000)
+
+    else:
+        scanned_at = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if scanned_at.tzinfo is not None:
+            scanned_at = scanned_at.astimezone(dt.timezone.utc).replace(tzinfo=None)
+
+    now = dt.datetime.utcnow()
+    if not now - QR_BATCH_MAX_AGE <= scanned_at <= now + QR_BATCH_MAX_SKEW:
+        raise ValueError("scanned_at out of range")
+    return min(scanned_at, now)
+
+
+@bp.route("/qr/batch", methods=["POST"])
+def post_qr_authorization_batch():
+    """키오스크에 모아둔 스캔(`{"scans": [{"qr_code", "scanned_at"}]}`)을 한번에 처리한다"""
+    print("api.auth.post_qr_authorization_batch")
+    data = request.get_json(silent=True) or {}
+    scans = data.get("scans")
+    if not isinstance(scans, list) or not scans or len(scans) > QR_BATCH_MAX:
+        return {"status": "reject", "message": "올바르지 않은 요청입니다."}, 400
+
+    scans = [scan if isinstance(scan, dict) else {} for scan in scans]
+    lookups = get_users_from_qr_codes([
+        scan.get("qr_code") if isinstance(scan.get("qr_code"), str) else "" for scan in scans
+    ])
+
+    results = []
+    last_logged: Dict[Tuple[int, bool], dt.datetime] = {}
+    for index, (scan, lookup) in enumerate(zip(scans, lookups)):
+        try:
+            scanned_at = _parse_scanned_at(scan.get("scanned_at"))
+        except (AttributeError, TypeError, ValueError, OverflowError, OSError):
+            results.append({"index": index, "status": "reject", "message": "잘못된 스캔 시간입니다."})
+            continue
+
+        if isinstance(lookup, ValueError):
+            results.append({"index": index, "status": "reject", "message": "잘못된 QR 입니다."})
+            continue
+
+        user, qr = lookup
+        result = {"index": index, "user_id": user.id}
+        if user.valid:
+            result["status"] = "confirm"
+            result["message"] = "인증되었습니다."
+            result["name"] = user.username
+            result["gender"] = user.gender
+            result["gradeClass"] = "text-" + get_grade_color(user.grade)
+        else:
+            result["status"] = "reject"
+            result["message"] = "인증되지 않았습니다."
+        results.append(result)
+
+        key = (user.id, bool(user.valid),)
+        first = key not in last_logged
+        if not first and abs((scanned_at - last_logged[key]).total_seconds()) < log_writer.DEDUPE_SECONDS:
+            result["duplicate"] = True
+            continue
+        last_logged[key] = scanned_at
+
+        # 사용자의 첫 스캔은 방금 /qr 로 들어온 같은 스캔과 겹칠 수 있으므로 log_writer 에서도 거른다
+        log = create_log(user, None, log_type="auth", extra_data={"success": bool(user.valid)})
+        log.created = scanned_at
+        if not log_writer.add_log(log, dedupe=first):
+            result["duplicate"] = True
+
+    return {"status": "confirm", "results": results}
+
+
 @bp.route("/qr", methods=["POST"])
 # @login_required
 def auth_qr():
@@ -351,10 +409,7 @@ def auth_qr():
         if user.grade >= Grade["vip"]:
             result["message"] = "VIP 회원권 재발급이 필요합니다!"
 
-    db.session.add(
-        create_log(user, None, log_type="auth", extra_data={"success": True})
-    )
-    db.session.commit()
+    log_writer.add_log(create_log(user, None, log_type="auth", extra_data={"success": True}), dedupe=True)
     return result
 
 
@@ -401,12 +456,8 @@ def post_sms_text_request():
 )
 def post_otp_request_debug():
     print("api.auth.post_otp_request_debug")
-    otp_storage[1] = {
-        "otp_code": get_new_otp(),
-        "created": dt.datetime.utcnow(),
-    }
     return {
         "status": "confirm",
         "message": "OTP 발급 성공",
-        "otp": otp_storage[1]["otp_code"],
+        "otp": issue_otp(1),
     }
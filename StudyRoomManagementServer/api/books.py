@@ -3,14 +3,14 @@ import json
 from typing import Dict, Union, Tuple, Optional, List
 
 import pytz
-from flask import Blueprint, request, current_app, Response, jsonify
-from werkzeug.wsgi import FileWrapper
+from flask import Blueprint, request, current_app, jsonify
 
 from StudyRoomManagementServer.auth_decorator import need_authorization, Authorization, check_user_from_cookie_authorization, \
     get_user_from_cookie_authorization
-from StudyRoomManagementServer.util import sms
-from StudyRoomManagementServer.util.timetable import create_timetable
-from StudyRoomManagementServer.util.utils import create_web_log
+from StudyRoomManagementServer.util import sms, user_cache
+from StudyRoomManagementServer.util.timetable import get_timetable_path
+from StudyRoomManagementServer.util.image_variant import send_image_variant
+from StudyRoomManagementServer.util.utils import create_web_log, get_request_fields
 from .lib.book import (
     raise_for_duplication,
     get_date_and_time,
@@ -26,6 +26,9 @@ from ..model import RoomBook, Room, User, db, Pay, Log, SavedMoney, Transaction,
 
 bp = Blueprint("books", __name__, url_prefix="/api/books")
 
+# fields 로 일부만 요청해도 목록을 만들 때 필요한 키
+_BOOK_KEYS = frozenset(("book_id", "room_id", "user_id", "department",))
+
 
 def _get_books_args() -> Tuple[int, dt.date, str]:
     user_id: int = request.args.get("user_id", type=int)
@@ -93,7 +96,9 @@ def get_books():
     if book_date is not None:
         q = q.filter_by(book_date=dt.datetime(book_date.year, book_date.month, book_date.day))
 
-    books = [rb.publics_to_dict() for rb in q.all()]
+    fields = get_request_fields()
+    book_serializer = RoomBook.serializer.only(None if fields is None else fields.own | _BOOK_KEYS)
+    books = book_serializer.dump_many(book_serializer.project(q))
 
     if department is not None:
         temp_books = []
@@ -108,17 +113,51 @@ def get_books():
 
         books = temp_books
 
-    for book in books:
-        book["room"] = Room.query.filter_by(id=book["room_id"]).order_by(Room.id.desc()).first().publics_to_dict()
-        book["user"] = User.query.filter_by(id=book["user_id"]).order_by(User.id.desc()).first().publics_to_dict()
+    if fields is None or fields.includes("room"):
+        rooms = _load_by(Room, Room.serializer, Room.id, "room_id", {book["room_id"] for book in books}, fields, "room")
+        for book in books:
+            book["room"] = rooms[book["room_id"]]
+
+    if fields is None or fields.includes("user"):
+        user_fields = fields.sub("user") if fields is not None else None
+        user_serializer = User.serializer_with_num if user_fields and "num" in user_fields.own else User.serializer
+        users = _load_by(User, user_serializer, User.id, "user_id", {book["user_id"] for book in books}, fields, "user")
+        for book in books:
+            book["user"] = users[book["user_id"]]
+
+    if fields is None or fields.includes("pay"):
+        pays = _load_by(Pay, Pay.serializer, Pay.book_id, "book_id", {book["book_id"] for book in books}, fields, "pay")
+        for book in books:
+            if book["book_id"] in pays:
+                book["pay"] = pays[book["book_id"]]
 
-        pay = Pay.query.filter_by(book_id=book["book_id"]).order_by(Pay.id.desc()).first()
-        if pay:
-            book["pay"] = pay.publics_to_dict()
+    if fields is not None:
+        for key in _BOOK_KEYS - fields.own:
+            for book in books:
+                del book[key]
 
     return {"message": "ok", "books": books}
 
 
+def _load_by(model, serializer, column, key: str, values: set, fields, name: str) -> Dict[int, dict]:
+    """column 값이 values 인 객체를 한번에 읽어 key 값 -> dict 로 반환한다(같은 값이면 id 가 큰 것)
+
+    fields 에서 name 의 하위 필드를 요청했으면 그 키만 읽어서 내보낸다.
+    """
+    if not values:
+        return {}
+
+    sub = fields.sub(name) if fields is not None else None
+    serializer = serializer.only(None if sub is None else sub.own | {key})
+    rows = serializer.dump_many(serializer.project(model.query.filter(column.in_(values)).order_by(model.id)))
+
+    result = {row[key]: row for row in rows}
+    if sub is not None and key not in sub.own:
+        for row in rows:
+            del row[key]
+    return result
+
+
 @bp.route("<string:date_string>.png")
 @check_user_from_cookie_authorization
 def get_book_timetable(date_string: str):
@@ -147,11 +186,8 @@ def get_book_timetable(date_string: str):
         .filter(RoomBook.status != RoomBook.STATUS_CANCELED)\
         .all()
 
-    f = FileWrapper(create_timetable(date_string, books, with_text))
-    response = Response(f, mimetype="image/png", direct_passthrough=True)
-    response.headers["Cache-Control"] = "no-cache"
-
-    return response
+    timetable_path, timetable_hash = get_timetable_path(date_string, books, with_text)
+    return send_image_variant(timetable_path, etag=timetable_hash)
 
 
 @bp.route("", methods=("POST",))
@@ -211,16 +247,17 @@ def _post_book_action_confirm(
     room_book.status = 200
     db.session.commit()
 
+    room: Room = Room.query.filter_by(id=room_book.room_id).first()
+    user: User = user_cache.get_user(room_book.user_id)
+
     book = room_book.publics_to_dict()
-    book["room"] = Room.query.filter_by(id=room_book.room_id).first().publics_to_dict()
-    book["user"] = User.query.filter_by(id=room_book.user_id).first().publics_to_dict()
+    book["room"] = room.publics_to_dict()
+    book["user"] = user.publics_to_dict()
 
     pay = Pay.query.filter_by(book_id=book["book_id"]).first()
     if pay:
         book["pay"] = pay.publics_to_dict()
 
-    room: Room = Room.query.filter_by(id=room_book.room_id).first()
-    user: User = User.query.filter_by(id=room_book.user_id).first()
     # __add_book_at_spreadsheet(room_book, room, user)
 
     if user.id == 1:
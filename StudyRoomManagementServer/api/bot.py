@@ -10,26 +10,28 @@ from StudyRoomManagementServer.controller.books import get_book_timetable_img, g
 from StudyRoomManagementServer.controller.users import get_qr_img_by_user_obj, update_user
 from StudyRoomManagementServer.error_handler import Conflict, NotFound, BadRequest, Forbidden
 from StudyRoomManagementServer.model import User, db
+from StudyRoomManagementServer.util import user_cache
+from StudyRoomManagementServer.util.table_version import CONFIG, versioned_etag
 
 bp = Blueprint("bot", __name__, url_prefix="/api/bot")
 
 
 @bp.route("/users/by_chat_id/<int:chat_id>", methods=["GET"])
 def get_user_by_chat_id(chat_id: int):
-    user = User.query.filter_by(chat_id=chat_id).first()
+    user = user_cache.get_user_by_chat_id(chat_id)
 
     if user:
-        return user.publics_to_dict()
+        return user.publics_to_dict(with_num=True)
 
     raise NotFound("No User", f"chat_id={chat_id}")
 
 
 @bp.route("/users/<int:user_id>", methods=["GET"])
 def get_user_by_user_id(user_id: int):
-    user = User.query.filter_by(id=user_id).first()
+    user = user_cache.get_user(user_id)
 
     if user:
-        return user.publics_to_dict()
+        return user.publics_to_dict(with_num=True)
 
     raise NotFound("No User", f"user_id={user_id}")
 
@@ -127,7 +129,7 @@ def challenge_sms_code_by_chat_id(chat_id: int):
 
 @bp.route("/users/by_chat_id/<int:chat_id>/qr.png", methods=["GET"])
 def get_qr_img_by_chat_id(chat_id: int):
-    user = User.query.filter_by(chat_id=chat_id).first()
+    user = user_cache.get_user_by_chat_id(chat_id)
 
     if not user:
         raise NotFound("No User", f"chat_id={chat_id}")
@@ -152,25 +154,26 @@ def get_book_list_by_date_str(date_str: str):
 
 @bp.route("/books/<string:date_str>/<int:chat_id>", methods=["GET"])
 def get_book_list_by_chat_id_and_date_str(date_str: str, chat_id: int):
-    user_id = User.query.filter_by(chat_id=chat_id).first().id
+    user_id = user_cache.get_user_by_chat_id(chat_id).id
     return get_book_list(date_str, user_id)
 
 
 @bp.route("/users/by_chat_id/<int:chat_id>/books/<int:book_id>", methods=["DELETE"])
 def del_book_by_chat_id(chat_id: int, book_id: int):
-    user_id = User.query.filter_by(chat_id=chat_id).first().id
+    user_id = user_cache.get_user_by_chat_id(chat_id).id
     reason = request.form.get("reason", type=str)
     return delete_book(user_id, book_id, reason)
 
 
 @bp.route("/admin/<int:admin_id>/<int:chat_id>/books/<int:book_id>", methods=["DELETE"])
 def del_book_by_admin(admin_id: int, chat_id: int, book_id: int):
-    user_id = User.query.filter_by(chat_id=chat_id).first().id
+    user_id = user_cache.get_user_by_chat_id(chat_id).id
     reason = request.form.get("reason", type=str)
     return delete_book_by_admin(user_id, book_id, admin_id, reason)
 
 
 @bp.route("/config/book/open_close_time", methods=["GET"])
+@versioned_etag(CONFIG)
 def get_config_book_room_open_close_time():
     config_obj = get_config_obj()
     return {
@@ -16,6 +16,7 @@ from flask import send_file
 from StudyRoomManagementServer.auth_decorator import check_user_from_cookie_authorization
 from StudyRoomManagementServer.util.qr_img import __create_membership_image
 from ..cms_config import get_config as get_config_obj
+from ..util.table_version import CONFIG, versioned_etag
 
 TEST_REGEX = re.compile(r"\w+\.\w{1,5}")
 SAMPLE_USER_ID = 0
@@ -27,6 +28,7 @@ bp = Blueprint("config", __name__, url_prefix="/api/config")
 
 
 @bp.route("/cafe_open_time_text")
+@versioned_etag(CONFIG)
 def get_config_cafe_open_time_text():
     config_key = "cafe_open_time_text"
     config = get_config_obj()
@@ -37,6 +39,7 @@ def get_config_cafe_open_time_text():
 
 
 @bp.route("/cafe_close_time_text")
+@versioned_etag(CONFIG)
 def get_config_cafe_close_time_text():
     config_key = "cafe_close_time_text"
     config = get_config_obj()
@@ -48,6 +51,7 @@ def get_config_cafe_close_time_text():
 
 @bp.route('/<string:config_key>')
 @check_user_from_cookie_authorization
+@versioned_etag(CONFIG)
 def get_config(config_key: str):
     config = get_config_obj()
     if hasattr(config, config_key):
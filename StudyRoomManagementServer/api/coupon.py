@@ -9,6 +9,8 @@ from flask import (
 )
 
 from StudyRoomManagementServer.util.enum_base import StrEnum
+from StudyRoomManagementServer.util.num_index import get_user_by_num
+from StudyRoomManagementServer.util.utils import want_ndjson, stream_ndjson
 from ..model import db, Coupon
 
 bp = Blueprint("coupons", __name__, url_prefix="/api/coupons")
@@ -78,10 +80,13 @@ def get_coupon_amount(tel: str) -> int:
 
 
 def get_user_id(tel: str) -> Optional[int]:
-    try:
-        return Coupon.query.filter_by(tel=tel).order_by(Coupon.id.desc()).one().user_id
-    except:
-        return
+    coupon = Coupon.query.filter_by(tel=tel).filter(Coupon.user_id.isnot(None)).order_by(Coupon.id.desc()).first()
+    if coupon:
+        return coupon.user_id
+
+    user = get_user_by_num(tel)
+    if user:
+        return user.id
 
 
 @bp.route("", methods=("GET",))
@@ -185,9 +190,12 @@ def get_coupons():
         }
 
     elif request_type == RequestType.all:
+        if want_ndjson():
+            return stream_ndjson(Coupon.query, Coupon.serializer)
+
         coupons = Coupon.query.all()
         return {
-            "data": [coupon.to_dict() for coupon in coupons]
+            "data": Coupon.serializer.dump_many(coupons, native=True)
         }
 
     elif request_type == RequestType.view:
@@ -199,10 +207,13 @@ def get_coupons():
 
     elif request_type == RequestType.view_all:
         tel = get_tel()
+        if want_ndjson():
+            return stream_ndjson(Coupon.query.filter_by(tel=tel), Coupon.serializer)
+
         coupons = Coupon.query.filter_by(tel=tel).all()
 
         return {
-            "data": [coupon.to_dict() for coupon in coupons]
+            "data": Coupon.serializer.dump_many(coupons)
         }
 
     elif request_type == RequestType.is_message:
@@ -9,12 +9,14 @@ from werkzeug.datastructures import ImmutableMultiDict
 from StudyRoomManagementServer.auth_decorator import check_user_from_cookie_authorization
 from .lib.user import DEPARTMENT_DATA, get_department
 from ..model import SavedMoney
+from ..util.table_version import versioned_etag
 
 bp = Blueprint("departments", __name__, url_prefix="/api/departments")
 
 
 @bp.route("", methods=("GET",))
 @check_user_from_cookie_authorization
+@versioned_etag(SavedMoney)
 def get_departments():
     if not request.args:
         return {
@@ -83,7 +83,7 @@ def _export_log_donation(data: ImmutableMultiDict, types: str = "all") -> List[T
     elif "success" in types:
         pays = pays.filter(Pay.status==Pay.STATUS_CONFIRM)
 
-    pays = [pay.publics_to_dict() for pay in pays.all()]
+    pays = Pay.serializer.dump_many(pays)
 
     temp_data = defaultdict(list)
     for pay in pays:
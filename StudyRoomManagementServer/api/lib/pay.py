@@ -0,0 +1,43 @@
+from typing import Optional
+
+from StudyRoomManagementServer.util.receipt import Store, Receipt, CreditCard, Menu
+from ...model import Pay, RoomBook, Transaction, Room
+
+STORE = Store("카페", "부산 강서구 낙동북로 477 강서구청", "강서구", "000-00-12345", "010-0000-0000")
+
+
+def make_receipt(pay: Pay, room: Optional[Room], transaction: Optional[Transaction]) -> Receipt:
+    """조회된 지불 정보로 영수증 정보를 구성한다"""
+    menus = []
+    if pay.saved_money_id:
+        menus.append(Menu(f"적립", pay.paid, 1))
+    elif room.type == 1:
+        menus.append(Menu(f"스터디룸 {pay.paid / 1000}시간", pay.paid, 1))
+    elif room.type == 2:
+        menus.append(Menu(f"세미나룸 {pay.paid / 1000}시간", pay.paid, 1))
+    elif room.type == 3:
+        menus.append(Menu(f"컨퍼런스 {pay.paid / 1000}시간", pay.paid, 1))
+
+    if transaction:
+        payment = CreditCard(
+            transaction.issuer_name.strip(),
+            transaction.card_bin.strip(),
+            transaction.halbu,
+            int(transaction.authorization_number),
+            transaction.acquisition_company_name.strip()
+        )
+    else:
+        payment = None
+
+    return Receipt(pay.id, pay.created, menus, STORE, payment)
+
+
+def create_receipt(pay: Pay) -> Receipt:
+    """지불 정보로 영수증 정보를 생성한다"""
+    room = None
+    if not pay.saved_money_id:
+        book: RoomBook = RoomBook.query.filter_by(id=pay.book_id).first()
+        room = Room.query.filter_by(id=book.room_id).first()
+
+    transaction = Transaction.query.filter_by(pay_id=pay.id).first()
+    return make_receipt(pay, room, transaction)
@@ -8,6 +8,8 @@ from flask import Blueprint, request, current_app
 
 from ..model import db, User, Locker, LockerRental, LockerPayment
 from ..util.grade import is_admin
+from ..util.table_version import versioned_etag
+from ..util.utils import want_ndjson, stream_ndjson
 
 bp = Blueprint("locker", __name__, url_prefix="/api/locker")
 
@@ -88,6 +90,7 @@ def not_found() -> Tuple[Dict[str, str], int]:
 
 @bp.route("", methods=("GET",))
 # @check_user_from_cookie_authorization
+@versioned_etag(Locker)
 def get_lockers():
     """(전체)? 락커 조회"""
     locker_id = request.args.get("locker_id", type=int)
@@ -97,7 +100,7 @@ def get_lockers():
     if locker_id:
         return q.filter_by(id=locker_id).first().to_dict()
 
-    return {"data": [locker.to_dict() for locker in q.all()]}
+    return {"data": Locker.serializer.dump_many(q)}
 
 
 @bp.route("", methods=("POST",))
@@ -272,7 +275,7 @@ def get_rental_payment(locker_rental_id: int, locker_payment_id: int):
 
     if locker_payment_id == 0:
         payments = LockerPayment.query.filter_by(locker_rental_id=rental.id).all()
-        return {"data": [payment.to_dict() for payment in payments]}
+        return {"data": LockerPayment.serializer.dump_many(payments)}
 
     payment = LockerPayment.query.filter_by(id=locker_payment_id, locker_rental_id=rental.id).first()
     if not payment:
@@ -514,7 +517,10 @@ def get_rental(locker_rental_id: int):
             else:
                 return rental.to_dict()
 
-        return {"data": [rental.to_dict() for rental in LockerRental.query.all()]}
+        if want_ndjson():
+            return stream_ndjson(LockerRental.query, LockerRental.serializer)
+
+        return {"data": LockerRental.serializer.dump_many(LockerRental.query, native=True)}
     rental = LockerRental.query.filter_by(id=locker_rental_id).first()
     if not rental:
         return bad_request()
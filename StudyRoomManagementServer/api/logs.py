@@ -6,6 +6,7 @@ from flask import (
 )
 
 from StudyRoomManagementServer.auth_decorator import check_user_from_cookie_authorization
+from StudyRoomManagementServer.util.utils import want_ndjson, stream_ndjson, get_request_serializer
 from ..model import db, Log
 
 bp = Blueprint("logs", __name__, url_prefix="/api/logs")
@@ -31,11 +32,17 @@ def get_logs():
         q = q.filter(Log.created >= before_dt.isoformat(" "))
         q = q.filter(Log.created <= after_dt.isoformat(" "))
 
+    serializer = get_request_serializer(Log.serializer)
+    q = serializer.project(q)
+
     need_all = request.args.get("date", type=str)
     if need_all == "all":
+        if want_ndjson():
+            return stream_ndjson(q, serializer)
+
         return {
             "message": "ok",
-            "logs": [log.publics_to_dict() for log in q.all()],
+            "logs": serializer.dump_many(q, native=True),
         }
 
     page = request.args.get("page", type=int, default=1)
@@ -44,7 +51,7 @@ def get_logs():
 
     return {
         "message": "ok",
-        "logs": [log.publics_to_dict() for log in q.items],
+        "logs": serializer.dump_many(q.items),
         "has_next": q.has_next,
         "has_prev": q.has_prev,
         "next_num": q.next_num,
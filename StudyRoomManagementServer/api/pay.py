@@ -1,23 +1,31 @@
 import datetime as dt
-from typing import Dict, Union, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Union, Tuple, Optional, List, Iterator
 
 from flask import (
     Blueprint,
     request,
     Response,
+    current_app,
 )
-from werkzeug.wsgi import FileWrapper
 
 from StudyRoomManagementServer.auth_decorator import check_user_from_cookie_authorization
-from StudyRoomManagementServer.util.receipt import Store, Receipt, CreditCard, Menu, make_receipt_image_file
-from StudyRoomManagementServer.util.utils import create_web_log
+from StudyRoomManagementServer.util.receipt import (
+    Receipt, get_receipt_image_path, render_receipt_text, render_receipt_escpos
+)
+from StudyRoomManagementServer.util.image_variant import send_image_variant
+from StudyRoomManagementServer.util.utils import create_web_log, stream_zip, get_request_serializer
 from .lib.book import get_client_name
+from .lib.pay import create_receipt, make_receipt
 from ..model import db, Pay, RoomBook, Transaction, SavedMoney, User, Room
 
 STATUS_WAITING = "waiting"
 STATUS_CONFIRM = "confirm"
 STATUS_REJECT = "reject"
 
+RECEIPT_EXPORT_WORKERS = 4
+RECEIPT_EXPORT_CHUNK = 32
+
 
 bp = Blueprint("pays", __name__, url_prefix="/api/pays")
 
@@ -50,7 +58,8 @@ def get_pays():
         q = q.filter(Pay.created >= before_dt.isoformat(" "))
         q = q.filter(Pay.created <= after_dt.isoformat(" "))
 
-    pays = [pay.publics_to_dict() for pay in q.all()]
+    serializer = get_request_serializer(Pay.serializer)
+    pays = serializer.dump_many(serializer.project(q))
     return {"message": "ok", "pays": pays}
 
 
@@ -79,40 +88,103 @@ def get_pay_receipt(pay_id: int):
     if pay is None:
         return {"message": "해당 지불건이 없습니다."}, 404
 
-    menus = []
-    store = Store("카페", "부산 강서구 낙동북로 477 강서구청", "강서구", "000-00-12345", "010-0000-0000")
-    if pay.saved_money_id:
-        menus.append(Menu(f"적립", pay.paid, 1))
-    else:
-        book: RoomBook = RoomBook.query.filter_by(id=pay.book_id).first()
-        room: Room = Room.query.filter_by(id=book.room_id).first()
-        if room.type == 1:
-            menus.append(Menu(f"스터디룸 {pay.paid / 1000}시간", pay.paid, 1))
-        elif room.type == 2:
-            menus.append(Menu(f"세미나룸 {pay.paid / 1000}시간", pay.paid, 1))
-        elif room.type == 3:
-            menus.append(Menu(f"컨퍼런스 {pay.paid / 1000}시간", pay.paid, 1))
+    receipt_img_path = get_receipt_image_path(create_receipt(pay))
+    return send_image_variant(receipt_img_path)
 
-    transaction = Transaction.query.filter_by(pay_id=pay_id).first()
-    if transaction:
-        payment = CreditCard(
-            transaction.issuer_name.strip(),
-            transaction.card_bin.strip(),
-            transaction.halbu,
-            int(transaction.authorization_number),
-            transaction.acquisition_company_name.strip()
-        )
-    else:
-        payment = None
 
-    receipt_img_file = make_receipt_image_file(Receipt(pay.id, pay.created, menus, store, payment))
-    f = FileWrapper(receipt_img_file)
-    response = Response(f, mimetype="image/png", direct_passthrough=True)
+@bp.route("/<int:pay_id>/receipt.txt", methods=("GET",))
+@check_user_from_cookie_authorization
+def get_pay_receipt_text(pay_id: int):
+    pay = Pay.query.filter_by(id=pay_id).first()
+    if pay is None:
+        return {"message": "해당 지불건이 없습니다."}, 404
+
+    response = Response(render_receipt_text(create_receipt(pay)), mimetype="text/plain")
+    response.headers["Cache-Control"] = "no-cache"
+
+    return response
+
+
+@bp.route("/<int:pay_id>/receipt.escpos", methods=("GET",))
+@check_user_from_cookie_authorization
+def get_pay_receipt_escpos(pay_id: int):
+    pay = Pay.query.filter_by(id=pay_id).first()
+    if pay is None:
+        return {"message": "해당 지불건이 없습니다."}, 404
+
+    response = Response(render_receipt_escpos(create_receipt(pay)), mimetype="application/octet-stream")
     response.headers["Cache-Control"] = "no-cache"
 
     return response
 
 
+@bp.route("/receipts.zip", methods=("GET",))
+@check_user_from_cookie_authorization
+def get_pay_receipts_zip():
+    """기간 내 영수증 이미지를 ZIP 으로 내려받는다"""
+    start_date = request.args.get("start_date", type=dt.date.fromisoformat)
+    end_date = request.args.get("end_date", type=dt.date.fromisoformat)
+    if start_date is None or end_date is None or start_date > end_date:
+        return {"message": "올바르지 않은 요청입니다."}, 400
+
+    before_dt = dt.datetime.fromordinal(start_date.toordinal()) - dt.timedelta(hours=9)
+    after_dt = dt.datetime.fromordinal(end_date.toordinal()) - dt.timedelta(hours=9) + dt.timedelta(days=1)
+
+    q = db.session.query(Pay, Transaction, Room)\
+        .outerjoin(Transaction, Transaction.pay_id == Pay.id)\
+        .outerjoin(RoomBook, RoomBook.id == Pay.book_id)\
+        .outerjoin(Room, Room.id == RoomBook.room_id)\
+        .filter(Pay.created >= before_dt.isoformat(" "))\
+        .filter(Pay.created < after_dt.isoformat(" "))
+
+    status = request.args.get("status", type=str)
+    if status is not None:
+        q = q.filter(Pay.status == status)
+
+    pay_type = request.args.get("pay_type", type=str)
+    if pay_type is not None:
+        q = q.filter(Pay.pay_type.like(f"{pay_type}%"))
+
+    cashier = request.args.get("cashier", type=str)
+    if cashier is not None:
+        q = q.filter(Pay.cashier == cashier)
+
+    user_id = request.args.get("user_id", type=int)
+    if user_id is not None:
+        q = q.filter(Pay.user_id == user_id)
+
+    receipts: List[Receipt] = []
+    exported = set()
+    for pay, transaction, room in q.order_by(Pay.id, Transaction.id).all():
+        if pay.id in exported:
+            continue
+        exported.add(pay.id)
+
+        try:
+            receipts.append(make_receipt(pay, room, transaction))
+        except Exception as e:
+            print(f"get_pay_receipts_zip: pay_id={pay.id}, e={e}")
+
+    workers = current_app.config.get("RECEIPT_EXPORT_WORKERS", RECEIPT_EXPORT_WORKERS)
+    response = Response(_render_receipt_files(receipts, workers), mimetype="application/zip")
+    response.headers["Content-Disposition"] = \
+        f"attachment; filename=receipts_{start_date.isoformat()}_{end_date.isoformat()}.zip"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _render_receipt_files(receipts: List[Receipt], workers: int) -> Iterator[bytes]:
+    """영수증을 병렬로 그리면서 ZIP 으로 내보낸다"""
+    def files():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i in range(0, len(receipts), RECEIPT_EXPORT_CHUNK):
+                chunk = receipts[i:i + RECEIPT_EXPORT_CHUNK]
+                for receipt, file_path in zip(chunk, executor.map(get_receipt_image_path, chunk)):
+                    yield f"receipt_{receipt.no}.png", file_path
+
+    return stream_zip(files())
+
+
 def __add_saved_money(paid: int, name: Optional[str] = None, user_id: Optional[int] = None) -> SavedMoney:
     if name is not None and len(name.strip()) > 0:
         sm = SavedMoney.query.filter_by(name=name).first()
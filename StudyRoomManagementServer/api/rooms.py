@@ -6,6 +6,7 @@ from flask import Blueprint, request
 from StudyRoomManagementServer.auth_decorator import check_user_from_cookie_authorization
 from .lib.book import raise_for_duplication
 from ..model import Room, RoomBook, db, Pay
+from ..util.table_version import versioned_etag
 
 
 class BlockBook(NamedTuple):
@@ -140,6 +141,7 @@ def is_room_available(
 
 @bp.route("", methods=("GET",))
 @check_user_from_cookie_authorization
+@versioned_etag(Room, RoomBook)
 def get_rooms():
     try:
         date = dt.date.fromisoformat(request.args.get("date", type=str))
@@ -160,7 +162,7 @@ def get_rooms():
                     print(e)
                     continue
         else:
-            rooms = [r.publics_to_dict() for r in q.all()]
+            rooms = Room.serializer.dump_many(q)
     except Exception as e:
         print(e)
         return {"message": "Not iso format", "reason": "Not iso format"}, 400
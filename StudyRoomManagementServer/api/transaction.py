@@ -7,8 +7,10 @@ from flask import (
 )
 
 from StudyRoomManagementServer.auth_decorator import check_user_from_cookie_authorization
-from StudyRoomManagementServer.util.utils import create_web_log
+from StudyRoomManagementServer.util.receipt import get_receipt_image_path
+from StudyRoomManagementServer.util.utils import create_web_log, want_ndjson, stream_ndjson, get_request_serializer
 from .lib.book import get_client_name
+from .lib.pay import create_receipt
 from ..model import Transaction, User, Pay, db, SavedMoney, RoomBook, Message
 
 bp = Blueprint("transaction", __name__, url_prefix="/api/transaction")
@@ -59,10 +61,12 @@ def get_transaction():
 @bp.route("/all", methods=['GET'])
 @check_user_from_cookie_authorization
 def get_all_transactions():
-    result = [
-        t.publics_to_dict() for t in
-        Transaction.query.all()
-    ]
+    serializer = get_request_serializer(Transaction.serializer)
+    q = serializer.project(Transaction.query)
+    if want_ndjson():
+        return stream_ndjson(q, serializer)
+
+    result = serializer.dump_many(q, native=True)
     return {
         "message": "ok",
         "transactions": result
@@ -112,6 +116,7 @@ def post_transaction():
     db.session.commit()
 
     response_original = request.form.get("response_original", type=str)
+    confirmed = False
     pay = Pay.query.filter_by(id=transaction.pay_id).first()
     if response_original is not None and response_original.startswith("[ERROR]"):
         pay.status = Pay.STATUS_REJECT
@@ -122,7 +127,7 @@ def post_transaction():
         db.session.add(create_web_log("transaction.card.refund.success", pay.publics_to_dict(), pay.user_id))
 
     else:
-        _update_card_payment(pay, transaction)
+        confirmed = _update_card_payment(pay, transaction)
 
     if str(pay.pay_type).startswith("donation.card") and pay.status == Pay.STATUS_CONFIRM:
         sm: SavedMoney = SavedMoney.query.filter_by(id=pay.saved_money_id).first()
@@ -136,6 +141,10 @@ def post_transaction():
     db.session.add(pay)
     db.session.add(transaction)
     db.session.commit()
+
+    if confirmed:
+        _prewarm_receipt(pay)
+
     return {
         "message": "ok",
         "transaction": transaction.publics_to_dict()
@@ -153,8 +162,16 @@ def _update_pay_timeout(transaction: Transaction):
     db.session.commit()
 
 
-def _update_card_payment(pay: Pay, transaction: Transaction):
-    """카드 결제 처리"""
+def _prewarm_receipt(pay: Pay):
+    """영수증 전송 전에 영수증 이미지를 미리 만들어 둔다"""
+    try:
+        get_receipt_image_path(create_receipt(pay))
+    except Exception as e:
+        print(e)
+
+
+def _update_card_payment(pay: Pay, transaction: Transaction) -> bool:
+    """카드 결제 처리(승인되어 영수증 전송 메시지를 등록하면 True)"""
     if transaction.transaction_amount is None:
         pay.status = Pay.STATUS_REJECT
         pay.comment = "카드 결제 오류"
@@ -172,6 +189,8 @@ def _update_card_payment(pay: Pay, transaction: Transaction):
                 data=f"{pay.id}",
                 states=Message.STATE_RECEIPT_SEND,
             ))
+            db.session.add(pay)
+            return True
         else:
             pay.status = Pay.STATUS_REJECT
             pay.comment = f"{transaction.response_message}".strip()
@@ -179,6 +198,7 @@ def _update_card_payment(pay: Pay, transaction: Transaction):
         pay.status = Pay.STATUS_REJECT
         pay.comment = "카드 결제 오류"
     db.session.add(pay)
+    return False
 
 
 def _update_card_refund(pay: Pay, transaction: Transaction):
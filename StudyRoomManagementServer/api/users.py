@@ -1,24 +1,14 @@
-from secrets import token_urlsafe
-from typing import Tuple
-
 from flask import (
     Blueprint,
     request,
-    Response
 )
-from werkzeug.wsgi import FileWrapper
 
 from StudyRoomManagementServer.auth_decorator import check_user_from_cookie_authorization
-from StudyRoomManagementServer.util.qr_code import parse_qr_code
-from StudyRoomManagementServer.util.qr_img import create_qr_image
+from StudyRoomManagementServer.controller.users import send_qr_image, get_or_create_qr, reissue_qr
+from StudyRoomManagementServer.util.qr_code import parse_qr_code, create_qr_code
+from StudyRoomManagementServer.util.utils import want_ndjson, stream_ndjson, get_request_serializer
 from .lib import user as checker
-from ..model import User, db, QR
-
-
-def generate_new_qr_key_v1() -> Tuple[str, str]:
-    skey = token_urlsafe(64)
-    ukey = skey
-    return skey, ukey,
+from ..model import User, db
 
 
 bp = Blueprint("users", __name__, url_prefix="/api/users")
@@ -32,9 +22,14 @@ BOOK_STATUS_FIELD = 250
 @bp.route("", methods=("GET",))
 @check_user_from_cookie_authorization
 def get_users():
+    serializer = get_request_serializer(User.serializer_with_num)
+    q = serializer.project(User.query)
+    if want_ndjson():
+        return stream_ndjson(q, serializer)
+
     return {
         "message": "ok",
-        "users": [u.publics_to_dict() for u in User.query.all()]
+        "users": serializer.dump_many(q, native=True)
     }
 
 
@@ -44,7 +39,7 @@ def get_user_by_id(user_id: int):
 
     return {
         "message": "ok",
-        "user": User.query.filter_by(id=user_id).first().publics_to_dict()
+        "user": User.query.filter_by(id=user_id).first().publics_to_dict(with_num=True)
     }
 
 
@@ -54,7 +49,7 @@ def get_user_by_chat_id(chat_id: int):
 
     return {
         "message": "ok",
-        "user": User.query.filter_by(chat_id=chat_id).first().publics_to_dict()
+        "user": User.query.filter_by(chat_id=chat_id).first().publics_to_dict(with_num=True)
     }
 
 
@@ -69,24 +64,29 @@ def user_qr_image(user_id: int):
     elif not user.valid:
         return {"message": "Need SMS auth"}, 403
 
-    if not user.qr:
-        skey, ukey = generate_new_qr_key_v1()
-        qr = QR(user_id=user.id, skey=skey, revision=1)
-        db.session.add(qr)
-        db.session.commit()
-    else:
-        qr = user.qr[-1]
-    qr_img = create_qr_image(user, qr)
-
-    return Response(FileWrapper(qr_img), mimetype="image/png", direct_passthrough=True)
+    return send_qr_image(user, get_or_create_qr(user))
 
 
 @bp.route("/<int:user_id>/qr.txt", methods=("GET",))
 @check_user_from_cookie_authorization
 def user_qr_txt(user_id: int):
     user = User.query.filter_by(id=user_id).first()
-    qr = user.qr[-1]
-    return {"message": f"{qr.revision}0{user.id:04x}{qr.skey}"}
+    if not user:
+        return {"message": "No user"}, 404
+
+    return {"message": create_qr_code(user, get_or_create_qr(user))}
+
+
+@bp.route("/<int:user_id>/qr", methods=("POST",))
+@check_user_from_cookie_authorization
+def user_qr_reissue(user_id: int):
+    """QR 재발급(분실 등): 이전 QR 은 더 이상 인증되지 않는다"""
+    user = User.query.filter_by(id=user_id).first()
+    if not user:
+        return {"message": "No user"}, 404
+
+    qr = reissue_qr(user)
+    return {"message": "ok", "qr_id": qr.id, "revision": qr.revision}
 
 
 @bp.route("/qr", methods=("POST",))
@@ -172,4 +172,4 @@ def put_user(user_id: int):
 
     db.session.commit()
 
-    return {"user": user.publics_to_dict()}
+    return {"user": user.publics_to_dict(with_num=True)}
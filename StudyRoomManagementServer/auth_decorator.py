@@ -4,9 +4,10 @@ from enum import Enum, auto
 from typing import Optional, Tuple, Union
 
 import jwt
-from flask import request, current_app
+from flask import request, current_app, g
 
 from StudyRoomManagementServer.util.qr_code import parse_qr_code
+from StudyRoomManagementServer.util.user_cache import get_user, get_user_by_chat_id
 from .model import User
 
 
@@ -30,6 +31,41 @@ class Authorization(StrEnum):
     CONFIG = auto()
 
 
+def _load_user(user_id: int) -> Optional[User]:
+    """요청 안에서 같은 사용자는 한번만 읽는다"""
+    users = g.setdefault("auth_users", {})
+    if user_id not in users:
+        users[user_id] = get_user(user_id)
+    return users[user_id]
+
+
+def _get_request_chat_id() -> Optional[int]:
+    """Chat-Id 헤더 또는 chat_id 값(없거나 숫자가 아니면 None)"""
+    if "Chat-Id" in request.headers:
+        return request.headers.get("Chat-Id", type=int)
+    return request.values.get("chat_id", type=int)
+
+
+def _load_user_by_chat_id(chat_id: int) -> Optional[User]:
+    """요청 안에서 같은 chat_id 의 사용자는 한번만 읽는다"""
+    users = g.setdefault("auth_users_by_chat_id", {})
+    if chat_id not in users:
+        users[chat_id] = get_user_by_chat_id(chat_id)
+    return users[chat_id]
+
+
+def _decode_bearer_token(token: str) -> Optional[int]:
+    """JWT 를 요청마다 한번만 해석해 user_id 를 반환한다(잘못된 토큰은 None)"""
+    tokens = g.setdefault("auth_tokens", {})
+    if token not in tokens:
+        try:
+            tokens[token] = jwt.decode(token, current_app.config.get("JWT_SECRET_KEY"), algorithms="HS256")["user_id"]
+        except (jwt.PyJWTError, KeyError) as e:
+            print(e)
+            tokens[token] = None
+    return tokens[token]
+
+
 def need_authorization(allow: Union[Tuple[str], Tuple[Authorization, Authorization]] = tuple(Authorization)):
     allow = set(allow)
 
@@ -47,14 +83,14 @@ def need_authorization(allow: Union[Tuple[str], Tuple[Authorization, Authorizati
 
             auth_type, auth_code = authorization.split(' ', 1)
             if (Authorization.QR in allow or Authorization.QRV1 in allow) and auth_type == "QR":
-                user = User.query.filter_by(id=parse_qr_code(auth_code)[1]).first()
+                user = _load_user(parse_qr_code(auth_code)[1])
                 if not user:
                     print(f"UnAuthorization: {auth_type} {'No User'}")
                     return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
                 return func(user, *args, **kwargs)
 
             elif (Authorization.QR in allow or Authorization.QRV2 in allow) and auth_type == "QRV2":
-                user = User.query.filter_by(id=parse_qr_code(auth_code)[1]).first()
+                user = _load_user(parse_qr_code(auth_code)[1])
                 if not user:
                     print(f"UnAuthorization: {auth_type} {'No User'}")
                     return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
@@ -73,15 +109,15 @@ def need_authorization(allow: Union[Tuple[str], Tuple[Authorization, Authorizati
                     print(f"UnAuthorization: {auth_type} {auth_code} {'No Chat-Id'}")
                     return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
 
-                user = User.query.filter_by(chat_id=chat_id).first()
+                user = _load_user_by_chat_id(chat_id)
                 if not user:
                     print(f"UnAuthorization: {auth_type} {auth_code} {'No User'}")
                     return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
                 return func(user, *args, **kwargs)
 
             elif Authorization.WEB in allow and auth_type == "Bearer":
-                decoded = jwt.decode(auth_code, current_app.config.get("JWT_SECRET_KEY"), algorithms="HS256")
-                user = User.query.filter_by(id=decoded["user_id"]).first()
+                user_id = _decode_bearer_token(auth_code)
+                user = _load_user(user_id) if user_id is not None else None
                 if not user:
                     print(f"UnAuthorization: {auth_type} {auth_code} {'No User'}")
                     return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
@@ -91,14 +127,14 @@ def need_authorization(allow: Union[Tuple[str], Tuple[Authorization, Authorizati
                 if current_app.config.get("AUTH", {}).get(auth_type) == auth_code:
                     if "Chat-Id" in request.headers:
                         chat_id = request.headers.get("Chat-Id", type=int, default=-1)
-                        user = User.query.filter_by(chat_id=chat_id).first()
+                        user = _load_user_by_chat_id(chat_id)
                         if not user:
                             print(f"UnAuthorization: {auth_type} {auth_code} {'No User'}")
                             return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
                         return func(user, *args, **kwargs)
                     elif "User-Id" in request.headers:
                         user_id = request.headers.get("User-Id", type=int, default=-1)
-                        user = User.query.filter_by(id=user_id).first()
+                        user = _load_user(user_id)
                         if not user:
                             print(f"UnAuthorization: {auth_type} {auth_code} {'No User'}")
                             return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
@@ -133,19 +169,26 @@ def create_bearer_token(user: User, expire: Optional[dt.datetime] = None) -> str
 
 
 def check_bearer_token(token: str) -> Optional[User]:
-    decoded = jwt.decode(token, current_app.config.get("JWT_SECRET_KEY"), algorithms="HS256")
-    user = User.query.filter_by(id=decoded["user_id"]).first()
-    if not user:
+    user_id = _decode_bearer_token(token)
+    if user_id is None:
         return None
-    return user
+    return _load_user(user_id)
 
 
-def get_user_from_cookie_authorization() -> User:
+def _get_cookie_user_id() -> Optional[int]:
     auth = request.cookies.get("Authorization")
     if not auth:
+        return None
+    return _decode_bearer_token(auth)
+
+
+def get_user_from_cookie_authorization() -> User:
+    """쿠키로 인증된 사용자(요청 안에서 한번만 읽는다)"""
+    user_id = _get_cookie_user_id()
+    if user_id is None:
         raise Exception({"status": "reject", "message": "인증 정보가 없습니다."})
 
-    user = check_bearer_token(auth)
+    user = _load_user(user_id)
     if not user:
         raise Exception({"status": "reject", "message": "인증 정보가 없습니다."})
 
@@ -159,11 +202,12 @@ def check_config_authorization(username: str, password: str) -> bool:
 def check_user_from_cookie_authorization(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        try:
-            user = get_user_from_cookie_authorization()
-            print(user)
-        except Exception as e:
-            print(e)
+        user_id = _get_cookie_user_id()
+        if user_id is None:
+            print(f"UnAuthorization: {'No Cookie'}")
+            return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
+        if not _load_user(user_id):
+            print(f"UnAuthorization: {'No User'}")
             return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
         return func(*args, **kwargs)
     return wrapper
@@ -190,11 +234,23 @@ def check_bot_authorization(func):
         except Exception as e:
             print(e)
             return {"status": "reject", "message": "인증 정보가 없습니다."}, 401
+        g.auth_bot = True
         return func(*args, **kwargs)
     return wrapper
 
 
 def get_user_from_bot_authorization() -> User:
+    """봇으로 인증된 사용자(check_bot_authorization 을 통과했으면 토큰은 다시 확인하지 않는다)"""
+    if g.get("auth_bot"):
+        chat_id = _get_request_chat_id()
+        if chat_id is None:
+            print(f"UnAuthorization: {'No Chat-Id'}")
+            raise Exception("인증 정보가 없습니다.")
+        user = _load_user_by_chat_id(chat_id)
+        if not user:
+            raise Exception("인증 정보가 없습니다.")
+        return user
+
     if "Authorization" not in request.headers:
         print(f"UnAuthorization: {'No Header'}")
         raise Exception("인증 정보가 없습니다.")
@@ -210,16 +266,14 @@ def get_user_from_bot_authorization() -> User:
         print(f"UnAuthorization: {auth_type} {auth_code} {'No AuthCode'}")
         raise Exception("인증 정보가 없습니다.")
 
-    if "Chat-Id" in request.headers:
-        chat_id = request.headers.get("Chat-Id", type=int, default=-1)
-    elif "chat_id" in request.values:
-        chat_id = request.values.get("chat_id", type=int, default=-1)
-    else:
+    chat_id = _get_request_chat_id()
+    if chat_id is None:
         print(f"UnAuthorization: {auth_type} {auth_code} {'No Chat-Id'}")
         raise Exception("인증 정보가 없습니다.")
 
-    user = User.query.filter_by(chat_id=chat_id).first()
+    user = _load_user_by_chat_id(chat_id)
     if not user:
         print(f"UnAuthorization: {auth_type} {auth_code} {'No User'}")
         raise Exception("인증 정보가 없습니다.")
+    g.auth_bot = True
     return user
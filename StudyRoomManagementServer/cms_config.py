@@ -5,6 +5,8 @@ from typing import Union, Set, Dict, List, Any, Tuple
 
 from flask import Flask, g
 
+from .util import table_version
+
 
 def trans_str_to_time(data: Union[str, datetime.time]) -> datetime.time:
     try:
@@ -36,17 +38,27 @@ class ConfigEncoder(json.JSONEncoder):
 class Config:
     __data: dict
     __path: str
+    __version: str
 
     def __init__(self, path: str):
         self.__data = {}
         self.__path = path
+        self.__version = ""
         self.load()
 
     def save(self):
         with open(self.__path, 'w') as f:
             json.dump(self.__data, f, ensure_ascii=False, indent=2, cls=ConfigEncoder)
+        table_version.bump(table_version.CONFIG)
+        self.__version = table_version.get_version(table_version.CONFIG)
+
+    @property
+    def stale(self) -> bool:
+        """다른 워커가 설정을 저장해 읽어 둔 내용이 오래되었는지"""
+        return self.__version != table_version.get_version(table_version.CONFIG)
 
     def load(self):
+        self.__version = table_version.get_version(table_version.CONFIG)
         if os.path.isfile(self.__path):
             with open(self.__path) as f:
                 try:
@@ -500,6 +512,8 @@ def init_app(app: Flask):
 
 def get_config() -> Config:
     if 'config' not in g:
+        if config.stale:
+            config.load()
         g.config = config
 
     return g.config
@@ -2,15 +2,15 @@ import datetime as dt
 from typing import Optional
 
 import pytz
-from flask import request, Response
-from werkzeug.wsgi import FileWrapper
+from flask import request
 
 # from .. import spreadsheet as sps
 from StudyRoomManagementServer.api.books import remove_no_show, create_book_from_block
 from StudyRoomManagementServer.constants import Grade
 from StudyRoomManagementServer.error_handler import Forbidden, NotFound
 from StudyRoomManagementServer.model import Room, RoomBook, User, db
-from StudyRoomManagementServer.util.timetable import create_timetable
+from StudyRoomManagementServer.util.timetable import get_timetable_path
+from StudyRoomManagementServer.util.image_variant import send_image_variant
 from StudyRoomManagementServer.util.utils import create_log
 
 
@@ -44,11 +44,8 @@ def get_book_timetable_img(date_string: str):
     # books: List[RoomBook] = RoomBook.query.filter_by(book_date=date).all()
     # books = [book for book in books if book.status != RoomBook.STATUS_CANCELED]
 
-    f = FileWrapper(create_timetable(date_string, books, with_text))
-    response = Response(f, mimetype="image/png", direct_passthrough=True)
-    response.headers["Cache-Control"] = "no-cache"
-
-    return response
+    timetable_path, timetable_hash = get_timetable_path(date_string, books, with_text)
+    return send_image_variant(timetable_path, etag=timetable_hash)
 
 
 def get_book_list(date_str: Optional[str] = None, user_id: Optional[int] = None):
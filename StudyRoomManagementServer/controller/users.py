@@ -3,16 +3,14 @@ import re
 from random import choice
 from secrets import token_urlsafe
 from string import digits
-from typing import Tuple, Optional
-
-from flask import (
-    send_file,
-)
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from StudyRoomManagementServer.error_handler import BadRequest, Forbidden
 from StudyRoomManagementServer.model import User
 from StudyRoomManagementServer.model import db, QR
-from StudyRoomManagementServer.util.qr_img import create_qr_image
+from StudyRoomManagementServer.util.qr_code import evict_qr
+from StudyRoomManagementServer.util.qr_img import get_qr_image_path
+from StudyRoomManagementServer.util.image_variant import send_image_variant
 
 AGE_MINIMUM = 18
 AGE_MAXIMUM = 100
@@ -105,21 +103,83 @@ def generate_new_code() -> int:
     return code
 
 
-def get_qr_img_by_user_obj(user: User):
-    if user.sms != 1:
-        raise Forbidden("Need SMS auth", f"chat_id={user.chat_id}")
+def get_latest_qr(user_id: int) -> Optional[QR]:
+    """가장 최근에 발급된 QR 한 줄만 읽는다"""
+    return QR.query.filter_by(user_id=user_id).order_by(QR.id.desc()).first()
 
-    skey = token_urlsafe(64)
-    qr = QR(
+
+def get_latest_qrs(user_ids: Iterable[int]) -> Dict[int, QR]:
+    """사용자별로 가장 최근에 발급된 QR 만 읽는다"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    latest_ids = db.select(db.func.max(QR.id)).where(QR.user_id.in_(user_ids)).group_by(QR.user_id)
+    return {qr.user_id: qr for qr in QR.query.filter(QR.id.in_(latest_ids)).all()}
+
+
+def _new_qr(user: User) -> QR:
+    return QR(
         user_id=user.id,
-        skey=skey,
+        skey=token_urlsafe(64),
         revision=1,
     )
+
+
+def get_or_create_qrs(users: List[User]) -> Dict[int, QR]:
+    """사용자별 현재 QR 을 반환한다(발급된 적이 없는 사용자만 한번에 새로 발급)"""
+    qrs = get_latest_qrs(user.id for user in users)
+    missing = [user for user in users if user.id not in qrs]
+    if missing:
+        for user in missing:
+            qrs[user.id] = _new_qr(user)
+            db.session.add(qrs[user.id])
+        db.session.commit()
+    return qrs
+
+
+def get_or_create_qr(user: User) -> QR:
+    """현재 QR 을 반환한다(발급된 적이 없을 때만 새로 발급)"""
+    qr = get_latest_qr(user.id)
+    if qr is None:
+        qr = _new_qr(user)
+        db.session.add(qr)
+        db.session.commit()
+    return qr
+
+
+def _next_revision(revision: Optional[int]) -> int:
+    """다음 리비전(V1 코드는 리비전 뒤의 첫 "0" 으로 나누므로 0 이 들어간 수는 건너뛴다)"""
+    revision = (revision or 0) + 1
+    while "0" in str(revision):
+        revision += 1
+    return revision
+
+
+def reissue_qr(user: User) -> QR:
+    """QR 을 새로 발급한다(이전 QR 과 서명된 QR 은 폐기)"""
+    latest = get_latest_qr(user.id)
+    qr = QR(
+        user_id=user.id,
+        skey=token_urlsafe(64),
+        revision=_next_revision(latest.revision if latest else None),
+    )
     db.session.add(qr)
     db.session.commit()
+    evict_qr(user.id, qr.id)
+    return qr
+
+
+def get_qr_img_by_user_obj(user: User):
+    if user.sms != 1:
+        raise Forbidden("Need SMS auth", f"chat_id={user.chat_id}")
+
+    return send_qr_image(user, get_or_create_qr(user))
+
 
-    qr_img = create_qr_image(user, qr)
-    return send_file(qr_img, mimetype="image/png")
+def send_qr_image(user: User, qr: QR):
+    """캐시된 회원권 이미지를 ETag 와 함께 보낸다(If-None-Match 가 같으면 304)"""
+    qr_img_path, qr_img_hash = get_qr_image_path(user, qr)
+    return send_image_variant(qr_img_path, etag=qr_img_hash, cache_control="private, no-cache")
 
 
 def update_user(
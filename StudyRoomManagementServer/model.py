@@ -3,28 +3,26 @@ import json
 from enum import auto
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, inspect
+from sqlalchemy import func
 from sqlalchemy.dialects.mysql import BIGINT
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from .constants.message_state import MessageState
-from .security import dec_v1, enc_v1
+from .security import dec_v1_cached, enc_v1, blind_index_v1
 from .util.enum_base import StrEnum
+from .util.serializer import Serializer, get_serializer, isoformat, date_isoformat
 
 db = SQLAlchemy()
 
 
 def publics_to_dict(self) -> dict:
-    dict_ = {}
-    for key in self.__mapper__.c.keys():
-        if not key.startswith("_"):
-            dict_[key] = getattr(self, key)
+    return get_serializer(self.__class__).dump(self)
 
-    for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-        if isinstance(prop, hybrid_property):
-            dict_[key] = getattr(self, key)
 
-    return dict_
+def _minute_isoformat(minute: int) -> str:
+    """하루의 분(1440 은 23:59)을 ISO 형식 시간으로 바꾼다"""
+    minute = 1439 if minute == 1440 else minute
+    return dt.time(hour=int(minute / 60), minute=int(minute % 60)).isoformat()
 
 
 class Room(db.Model):
@@ -41,18 +39,10 @@ class Room(db.Model):
             f'<Room(id={self.id}, name="{self.name}", type={self.type}, no={self.no})>'
         )
 
-    def publics_to_dict(self) -> dict:
-        dict_ = {}
-        for key in self.__mapper__.c.keys():
-            if not key.startswith("_"):
-                dict_[key] = getattr(self, key)
+    serializer = Serializer(rename={"id": "room_id"})
 
-        for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-            if isinstance(prop, hybrid_property):
-                dict_[key] = getattr(self, key)
-        dict_["room_id"] = dict_["id"]
-        del dict_["id"]
-        return dict_
+    def publics_to_dict(self) -> dict:
+        return self.serializer.dump(self)
 
 
 class RoomBook(db.Model):
@@ -110,38 +100,19 @@ class RoomBook(db.Model):
     def __repr__(self):
         return f"<RoomBook(id={self.id}, status={self.status}, room_id={self.room_id}, user_id={self.user_id}, book_date={self.book_date})>"
 
-    def publics_to_dict(self) -> dict:
-        dict_ = {}
-        for key in self.__mapper__.c.keys():
-            if not key.startswith("_"):
-                dict_[key] = getattr(self, key)
-
-        for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-            if isinstance(prop, hybrid_property):
-                dict_[key] = getattr(self, key)
-
-        dict_["book_id"] = dict_["id"]
-        dict_["book_date"] = dict_["book_date"].date().isoformat()
-
-        dict_["start_time_second"] = 1439 if dict_["start_time_second"] == 1440 else dict_["start_time_second"]
-        dict_["start_time"] = dt.time(
-            hour=int(dict_["start_time_second"] / 60),
-            minute=int(dict_["start_time_second"] % 60),
-        ).isoformat()
-
-        dict_["end_time_second"] = 1439 if dict_["end_time_second"] == 1440 else dict_["end_time_second"]
-        dict_["end_time"] = dt.time(
-            hour=int(dict_["end_time_second"] / 60),
-            minute=int(dict_["end_time_second"] % 60),
-        ).isoformat()
-
-        dict_["created"] = dict_["created"].isoformat()
-        dict_["modified"] = dict_["modified"].isoformat()
+    serializer = Serializer(
+        rename={"id": "book_id", "start_time_second": "start_time", "end_time_second": "end_time"},
+        convert={
+            "book_date": date_isoformat,
+            "start_time": _minute_isoformat,
+            "end_time": _minute_isoformat,
+            "created": isoformat,
+            "modified": isoformat,
+        },
+    )
 
-        del dict_["id"]
-        del dict_["start_time_second"]
-        del dict_["end_time_second"]
-        return dict_
+    def publics_to_dict(self) -> dict:
+        return self.serializer.dump(self)
 
 
 class User(db.Model):
@@ -159,6 +130,7 @@ class User(db.Model):
     age = db.Column(db.Integer)
     gender = db.Column(db.Integer)
     encrypted_num = db.Column(db.String(128))
+    num_index = db.Column(db.String(64), index=True)
     status = db.Column(db.Integer)
     grade = db.Column(db.Integer, nullable=False, default=0)
     department = db.Column(db.String(32))
@@ -173,36 +145,34 @@ class User(db.Model):
 
     @hybrid_property
     def num(self) -> str:
-        return dec_v1(self.encrypted_num)
+        return dec_v1_cached(self.encrypted_num)
 
     @num.setter
     def num(self, new_num: str) -> None:
         self.encrypted_num = enc_v1(new_num)
+        self.num_index = blind_index_v1(new_num)
 
     @hybrid_property
     def valid(self) -> bool:
         return self.sms == 1
 
     def __repr__(self) -> str:
-        return f"<User({self.id}, {self.username}, {self.birthday}, {self.gender}, {self.num}>"
-
-    def publics_to_dict(self) -> dict:
-        dict_ = {}
-        for key in self.__mapper__.c.keys():
-            if not key.startswith("_"):
-                dict_[key] = getattr(self, key)
+        return f"<User({self.id}, {self.username}, {self.birthday}, {self.gender})>"
 
-        for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-            if isinstance(prop, hybrid_property):
-                dict_[key] = getattr(self, key)
+    serializer = Serializer(
+        rename={"id": "user_id"},
+        exclude=("encrypted_num", "num_index", "num",),
+        convert={"created": isoformat, "modified": isoformat},
+    )
+    serializer_with_num = Serializer(
+        rename={"id": "user_id"},
+        exclude=("encrypted_num", "num_index",),
+        convert={"created": isoformat, "modified": isoformat},
+    )
 
-        dict_["created"] = dict_["created"].isoformat()
-        if "modified" in dict_ and isinstance(dict_["modified"], dt.datetime):
-            dict_["modified"] = dict_["modified"].isoformat()
-        dict_["user_id"] = dict_["id"]
-        del dict_["encrypted_num"]
-        del dict_["id"]
-        return dict_
+    def publics_to_dict(self, with_num: bool = False) -> dict:
+        """전화번호는 복호화가 필요하므로 with_num 일 때만 넣는다"""
+        return (self.serializer_with_num if with_num else self.serializer).dump(self)
 
 
 class QR(db.Model):
@@ -210,21 +180,22 @@ class QR(db.Model):
     __table_args__ = {"mysql_collate": "utf8_general_ci"}
 
     id = db.Column(db.Integer, primary_key=True, unique=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     skey = db.Column(db.String(128))
     revision = db.Column(db.Integer)
     created = db.Column(db.DateTime(timezone=True), default=func.now())
 
     def publics_to_dict(self) -> dict:
-        dict_ = {}
-        for key in self.__mapper__.c.keys():
-            if not key.startswith("_"):
-                dict_[key] = getattr(self, key)
+        return publics_to_dict(self)
 
-        for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-            if isinstance(prop, hybrid_property):
-                dict_[key] = getattr(self, key)
-        return dict_
+
+class Otp(db.Model):
+    __tablename__ = "otp"
+    __table_args__ = {"mysql_collate": "utf8_general_ci"}
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    otp_code = db.Column(db.String(16), nullable=False, unique=True)
+    created = db.Column(db.DateTime, nullable=False, default=dt.datetime.utcnow)
 
 
 class Log(db.Model):
@@ -263,19 +234,10 @@ class Log(db.Model):
         else:
             self.extra_data_str = None
 
-    def publics_to_dict(self) -> dict:
-        dict_ = {}
-        for key in self.__mapper__.c.keys():
-            if not key.startswith("_"):
-                dict_[key] = getattr(self, key)
-
-        for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-            if isinstance(prop, hybrid_property):
-                dict_[key] = getattr(self, key)
-
-        dict_["created"] = dict_["created"].isoformat()
+    serializer = Serializer(convert={"created": isoformat})
 
-        return dict_
+    def publics_to_dict(self) -> dict:
+        return self.serializer.dump(self)
 
 
 class Message(db.Model):
@@ -296,15 +258,7 @@ class Message(db.Model):
     states = db.Column(db.Integer)
 
     def publics_to_dict(self) -> dict:
-        dict_ = {}
-        for key in self.__mapper__.c.keys():
-            if not key.startswith("_"):
-                dict_[key] = getattr(self, key)
-
-        for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-            if isinstance(prop, hybrid_property):
-                dict_[key] = getattr(self, key)
-        return dict_
+        return publics_to_dict(self)
 
 
 class Pay(db.Model):
@@ -361,20 +315,10 @@ class Pay(db.Model):
         else:
             return "오류 상태"
 
-    def publics_to_dict(self) -> dict:
-        dict_ = {}
-        for key in self.__mapper__.c.keys():
-            if not key.startswith("_"):
-                dict_[key] = getattr(self, key)
-
-        for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-            if isinstance(prop, hybrid_property):
-                dict_[key] = getattr(self, key)
+    serializer = Serializer(rename={"id": "pay_id"}, convert={"created": isoformat})
 
-        dict_["pay_id"] = dict_["id"]
-        dict_["created"] = dict_["created"].isoformat()
-        del dict_["id"]
-        return dict_
+    def publics_to_dict(self) -> dict:
+        return self.serializer.dump(self)
 
 
 class Transaction(db.Model):
@@ -436,20 +380,10 @@ class Transaction(db.Model):
             money=money, tax=money - (money / 1.1), halbu=0, cat_id=Transaction.STUDY_CAT_ID
         )
 
-    def publics_to_dict(self) -> dict:
-        dict_ = {}
-        for key in self.__mapper__.c.keys():
-            if not key.startswith("_"):
-                dict_[key] = getattr(self, key)
-
-        for key, prop in inspect(self.__class__).all_orm_descriptors.items():
-            if isinstance(prop, hybrid_property):
-                dict_[key] = getattr(self, key)
+    serializer = Serializer(rename={"id": "transaction_id"}, convert={"created": isoformat})
 
-        dict_["transaction_id"] = dict_["id"]
-        dict_["created"] = dict_["created"].isoformat()
-        del dict_["id"]
-        return dict_
+    def publics_to_dict(self) -> dict:
+        return self.serializer.dump(self)
 
 
 class SavedMoney(db.Model):
@@ -482,11 +416,10 @@ class Locker(db.Model):
     main_key = db.Column(db.Integer, nullable=False, default=0)
     spare_key = db.Column(db.Integer, nullable=False, default=0)
 
+    serializer = Serializer(rename={"id": "locker_id"})
+
     def to_dict(self) -> dict:
-        dict_ = publics_to_dict(self)
-        dict_["locker_id"] = dict_["id"]
-        del dict_["id"]
-        return dict_
+        return self.serializer.dump(self)
 
 
 class LockerRental(db.Model):
@@ -504,15 +437,10 @@ class LockerRental(db.Model):
     deposit = db.Column(db.Integer, nullable=True)
     vitalization = db.Column(db.Boolean, nullable=False, default=True)
 
+    serializer = Serializer(rename={"id": "locker_rental_id"}, convert={"created": isoformat, "deadline": isoformat})
+
     def to_dict(self) -> dict:
-        dict_ = publics_to_dict(self)
-        dict_["locker_rental_id"] = dict_["id"]
-        if "created" in dict_:
-            dict_["created"] = dict_["created"].isoformat()
-        if "deadline" in dict_:
-            dict_["deadline"] = dict_["deadline"].isoformat()
-        del dict_["id"]
-        return dict_
+        return self.serializer.dump(self)
 
 
 class LockerPayment(db.Model):
@@ -535,13 +463,10 @@ class LockerPayment(db.Model):
     admission = db.Column(db.Integer, default=0)
     reason = db.Column(db.String(64))
 
+    serializer = Serializer(rename={"id": "locker_payment_id"}, convert={"created": isoformat})
+
     def to_dict(self) -> dict:
-        dict_ = publics_to_dict(self)
-        dict_["locker_payment_id"] = dict_["id"]
-        if "created" in dict_:
-            dict_["created"] = dict_["created"].isoformat()
-        del dict_["id"]
-        return dict_
+        return self.serializer.dump(self)
 
 
 class Coupon(db.Model):
@@ -572,13 +497,10 @@ class Coupon(db.Model):
     # 사용
     # find tel > sum(amount) > insert -amount
 
+    serializer = Serializer(rename={"id": "coupon_id"}, convert={"created": isoformat})
+
     def to_dict(self) -> dict:
-        dict_ = publics_to_dict(self)
-        dict_["coupon_id"] = dict_["id"]
-        if "created" in dict_:
-            dict_["created"] = dict_["created"].isoformat()
-        del dict_["id"]
-        return dict_
+        return self.serializer.dump(self)
 
 
 class CommuteBackup(db.Model):
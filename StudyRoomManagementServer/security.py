@@ -1,5 +1,9 @@
+import hashlib
+import hmac
+import re
 from base64 import b64decode, b64encode
-from typing import Tuple
+from functools import lru_cache
+from typing import Optional, Tuple
 
 from Cryptodome.Cipher import AES
 from flask import Flask
@@ -7,10 +11,18 @@ from flask import Flask
 SECURE_KEY: bytes = None
 SECURE_AAD: bytes = None
 SECURE_NONCE: bytes = None
+SECURE_INDEX_KEY: bytes = None
+
+DEC_CACHE_SIZE = 4096
 
 
 def init_app(app: Flask):
     init_key(app.config["SECURE_KEY"], app.config["SECURE_AAD"], app.config["SECURE_NONCE"])
+    init_index_key(app.config.get("SECURE_INDEX_KEY"))
+
+    global DEC_CACHE_SIZE, _dec_v1_lru
+    DEC_CACHE_SIZE = app.config.get("SECURE_DEC_CACHE_SIZE", DEC_CACHE_SIZE)
+    _dec_v1_lru = lru_cache(maxsize=DEC_CACHE_SIZE)(dec_v1)
 
 
 def init_key(secure_key: str, secure_aad: str, secure_nonce: str):
@@ -20,6 +32,20 @@ def init_key(secure_key: str, secure_aad: str, secure_nonce: str):
     SECURE_KEY = secure_key
     SECURE_AAD = secure_aad
     SECURE_NONCE = secure_nonce
+    _dec_v1_lru.cache_clear()
+
+
+def init_index_key(secure_index_key: Optional[str] = None):
+    """검색용 색인 키(없으면 SECURE_KEY 에서 만든다)"""
+    global SECURE_INDEX_KEY
+    if secure_index_key is None:
+        SECURE_INDEX_KEY = hmac.new(_to_bytes(SECURE_KEY), b"blind-index", hashlib.sha256).digest()
+    else:
+        SECURE_INDEX_KEY = _to_bytes(secure_index_key)
+
+
+def _to_bytes(value) -> bytes:
+    return value.encode("utf-8") if isinstance(value, str) else value
 
 
 # 암호화 함수
@@ -97,3 +123,25 @@ def dec_v1(encrypt_data: str) -> str:
         return plain_data.decode("utf-8")
 
     raise ValueError()
+
+
+_dec_v1_lru = lru_cache(maxsize=DEC_CACHE_SIZE)(dec_v1)
+
+
+def dec_v1_cached(encrypt_data: str) -> str:
+    """dec_v1 결과를 암호문 기준으로 DEC_CACHE_SIZE 개까지 기억한다"""
+    if not isinstance(encrypt_data, str):
+        return encrypt_data
+    return _dec_v1_lru(encrypt_data)
+
+
+def blind_index_v1(plain_text: str) -> Optional[str]:
+    """평문 대신 저장해서 같은 값을 찾을 수 있는 HMAC 색인(숫자만 사용하므로 '-' 유무와 상관없이 같다)"""
+    if not isinstance(plain_text, str):
+        return None
+
+    normalized = re.sub(r"\D", "", plain_text)
+    if not normalized:
+        return None
+
+    return hmac.new(SECURE_INDEX_KEY, normalized.encode("utf-8"), hashlib.sha256).hexdigest()
@@ -0,0 +1,122 @@
+"""생성한 이미지의 형식(WebP/AVIF)과 크기 변형
+
+원본 PNG 옆의 `variant` 폴더에 `{원본 이름}.w{너비}.{확장자}` 로 저장해 두고 다시 사용한다.
+"""
+import os
+import threading
+from glob import glob
+from typing import NamedTuple, Optional
+
+from PIL import Image, features
+from flask import Response, request
+
+from .utils import send_spool_file
+
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+FORMAT_PNG = "png"
+FORMAT_WEBP = "webp"
+FORMAT_AVIF = "avif"
+
+MIMETYPES = {
+    FORMAT_PNG: "image/png",
+    FORMAT_WEBP: "image/webp",
+    FORMAT_AVIF: "image/avif",
+}
+
+VARIANT_WIDTHS = (320, 480, 640, 960, 1280, 1600, 1920,)
+QUALITY = 80
+
+Image.init()
+WEBP_AVAILABLE = features.check("webp")
+AVIF_AVAILABLE = "AVIF" in Image.SAVE
+
+
+class Variant(NamedTuple):
+    """이미지 변형(형식, 너비)"""
+    format: str
+    width: Optional[int]
+
+    @property
+    def is_original(self) -> bool:
+        return self.format == FORMAT_PNG and self.width is None
+
+
+def _accepts(mimetype: str) -> bool:
+    """Accept 에 형식이 직접 적혀 있는가?(*/* 만 보내는 봇에는 PNG 를 준다)"""
+    return any(value == mimetype and quality > 0 for value, quality in request.accept_mimetypes)
+
+
+def get_request_variant() -> Variant:
+    """요청의 Accept 헤더와 `w` 로 보낼 변형을 정한다(너비는 VARIANT_WIDTHS 중 크거나 같은 값으로 맞춘다)"""
+    if AVIF_AVAILABLE and _accepts(MIMETYPES[FORMAT_AVIF]):
+        image_format = FORMAT_AVIF
+    elif WEBP_AVAILABLE and _accepts(MIMETYPES[FORMAT_WEBP]):
+        image_format = FORMAT_WEBP
+    else:
+        image_format = FORMAT_PNG
+
+    width = request.args.get("w", type=int)
+    if width is not None:
+        width = next((w for w in VARIANT_WIDTHS if w >= width), None) if width > 0 else None
+
+    return Variant(image_format, width)
+
+
+def _get_variant_dir(file_path: str) -> str:
+    return os.path.join(os.path.dirname(file_path), "variant")
+
+
+def _get_stem(file_path: str) -> str:
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def get_variant_path(file_path: str, variant: Variant) -> str:
+    """원본 PNG 의 변형 경로를 반환한다(없으면 생성)"""
+    if variant.is_original:
+        return file_path
+
+    variant_dir = _get_variant_dir(file_path)
+    variant_path = os.path.join(variant_dir, f"{_get_stem(file_path)}.w{variant.width or 0}.{variant.format}")
+    if os.path.isfile(variant_path):
+        return variant_path
+
+    with Image.open(file_path) as img:
+        if variant.width and variant.width < img.width:
+            img = img.resize((variant.width, round(img.height * variant.width / img.width),), Image.LANCZOS)
+        if variant.format != FORMAT_PNG and img.mode not in ("RGB", "RGBA",):
+            img = img.convert("RGB")
+
+        os.makedirs(variant_dir, exist_ok=True)
+        temp_path = f"{variant_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if variant.format == FORMAT_PNG:
+            img.save(temp_path, "PNG", optimize=True)
+        else:
+            img.save(temp_path, variant.format.upper(), quality=QUALITY)
+    os.replace(temp_path, variant_path)
+    return variant_path
+
+
+def remove_variants(file_path: str):
+    """원본 PNG 의 변형을 모두 지운다"""
+    for variant_path in glob(os.path.join(_get_variant_dir(file_path), f"{_get_stem(file_path)}.*")):
+        try:
+            os.remove(variant_path)
+        except OSError:
+            pass
+
+
+def send_image_variant(file_path: str, etag: Optional[str] = None, cache_control: str = "no-cache") -> Response:
+    """요청에 맞는 변형을 보낸다(변형마다 ETag 가 다르고 Vary: Accept 를 붙인다)"""
+    variant = get_request_variant()
+    if etag and not variant.is_original:
+        etag = f"{etag}-w{variant.width or 0}-{variant.format}"
+
+    response = send_spool_file(
+        get_variant_path(file_path, variant), MIMETYPES[variant.format], etag=etag, cache_control=cache_control
+    )
+    response.vary.add("Accept")
+    return response
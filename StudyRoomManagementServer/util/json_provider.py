@@ -0,0 +1,60 @@
+"""JSON 응답 인코더
+
+orjson 이 설치되어 있으면 orjson 으로, 없으면 표준 json 으로 인코딩한다.
+어느 쪽이든 날짜/시간은 ISO 형식으로 내보내므로 응답에 컬럼 값을 바꾸지 않고 그대로 넣어도 된다.
+"""
+import datetime as dt
+import typing as t
+
+from flask import Flask, Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(o: t.Any) -> t.Any:
+    if isinstance(o, (dt.date, dt.time,)):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+class IsoJSONProvider(DefaultJSONProvider):
+    """날짜/시간을 HTTP 날짜 대신 ISO 형식으로 내보내는 기본 인코더"""
+    default = staticmethod(_default)
+
+
+class OrjsonProvider(IsoJSONProvider):
+    """orjson 인코더(인자를 따로 준 dumps/loads 는 표준 json 으로 처리한다)"""
+
+    def _option(self, indent: bool = False) -> int:
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj: t.Any, **kwargs: t.Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._option()).decode("utf-8")
+
+    def loads(self, s: t.Union[str, bytes], **kwargs: t.Any) -> t.Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: t.Any, **kwargs: t.Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=self._option(indent) | orjson.OPT_APPEND_NEWLINE),
+            mimetype=self.mimetype,
+        )
+
+
+def init_app(app: Flask):
+    app.json = (OrjsonProvider if orjson is not None else IsoJSONProvider)(app)
@@ -0,0 +1,355 @@
+"""로그 일괄 기록기
+
+요청 스레드는 로그를 큐에 넣고 바로 돌아가며, 백그라운드 스레드가 FLUSH_INTERVAL 마다 또는 FLUSH_SIZE 개가 모이면
+한번에 INSERT 한다. 큐에 넣은 로그는 프로세스별 저널(JSON Lines)에도 기록하므로 프로세스가 죽어도
+다른 프로세스가 다시 기록한다(커밋 직후 죽으면 중복될 수 있다). 저널 조각은 쓰는 동안 flock 으로 잠가 두고,
+잠기지 않은 조각은 시작할 때와 REPLAY_INTERVAL 마다 주인이 죽은 것으로 보고 다시 기록한다.
+기록이 MAX_RETRY 번 연속 실패하거나 행 자체가 잘못된 경우(FK, 길이 등)에는 나눠서 기록하고,
+혼자서도 기록되지 않는 행은 DEAD_LETTER_PATH 에 남겨 나머지 로그를 막지 않는다.
+"""
+import atexit
+import datetime as dt
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from glob import glob
+from typing import IO, Dict, List, Optional, Tuple
+
+from flask import Flask
+from sqlalchemy import DateTime, insert, text
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError, StatementError
+
+from StudyRoomManagementServer.model import Log, db
+
+FLUSH_INTERVAL = 0.5
+FLUSH_SIZE = 100
+DEDUPE_SECONDS = 5
+MAX_RETRY = 3
+RETRY_MAX_DELAY = 30
+REPLAY_INTERVAL = 60
+
+JOURNAL_PATH: str = ""
+DEAD_LETTER_PATH: str = ""
+
+_app: Optional[Flask] = None
+_queue: "queue.Queue[dict]" = queue.Queue()
+_wakeup = threading.Event()
+_failures = 0
+_journal_lock = threading.Lock()
+_journal_file = None
+_journal_segments: List[str] = []
+_journal_held: Dict[str, IO] = {}
+_journal_token = ""
+_recent: Dict[Tuple, float] = {}
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+
+_DATETIME_COLUMNS = {column.key for column in Log.__table__.columns if isinstance(column.type, DateTime)}
+_SCALAR_DEFAULTS = {
+    column.key: column.default.arg
+    for column in Log.__table__.columns if column.default is not None and column.default.is_scalar
+}
+
+
+def _to_row(log: Log) -> dict:
+    """로그를 INSERT 할 값으로 바꾼다(생성 시간은 기록 시점이 아닌 지금으로 정한다)"""
+    row = {key: getattr(log, key) for key in Log.__mapper__.c.keys() if key != "id"}
+    for key, default in _SCALAR_DEFAULTS.items():
+        if row.get(key) is None:
+            row[key] = default
+    if row.get("created") is None:
+        row["created"] = dt.datetime.utcnow()
+    return row
+
+
+def _dump_row(row: dict) -> str:
+    return json.dumps(
+        {key: value.isoformat() if isinstance(value, dt.datetime) else value for key, value in row.items()},
+        ensure_ascii=False,
+    )
+
+
+def _load_row(line: str) -> dict:
+    row = json.loads(line)
+    for key in _DATETIME_COLUMNS:
+        if row.get(key):
+            row[key] = dt.datetime.fromisoformat(row[key])
+    return row
+
+
+def _journal_path(token: str, segment: int) -> str:
+    return os.path.join(JOURNAL_PATH, f"{token}.{segment}.jsonl")
+
+
+def _open_journal():
+    """새 저널 조각을 열어 잠근다(_journal_lock 안에서 호출, 기록하거나 지울 때까지 잠가 둔다)"""
+    global _journal_file
+    segment_path = _journal_path(_journal_token, time.monotonic_ns())
+    _journal_file = open(segment_path, "a", encoding="utf-8")
+    fcntl.flock(_journal_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    _journal_held[segment_path] = _journal_file
+    _journal_segments.append(segment_path)
+
+
+def _ensure_started():
+    """기록 스레드를 시작한다(fork 된 워커에서는 다시 시작)"""
+    global _thread, _thread_pid, _journal_token
+    if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+        return
+
+    with _journal_lock:
+        if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+            return
+        if _thread_pid != os.getpid():
+            for journal_file in _journal_held.values():  # 부모의 조각(잠금은 부모가 계속 가진다)
+                journal_file.close()
+            _journal_held.clear()
+            _journal_segments.clear()
+            _recent.clear()
+            _journal_token = uuid.uuid4().hex
+            _open_journal()
+        _thread_pid = os.getpid()
+        _thread = threading.Thread(target=_run, name="log-writer", daemon=True)
+        _thread.start()
+
+
+def add_log(log: Log, dedupe: bool = False) -> bool:
+    """로그를 기록 대기열에 넣는다
+
+    dedupe 이면 같은 사용자의 같은 로그가 DEDUPE_SECONDS 안에 다시 들어온 경우 버리고 False 를 반환한다.
+    """
+    _ensure_started()
+    row = _to_row(log)
+
+    with _journal_lock:
+        if dedupe:
+            key = (row["user_id"], row["log_type"], row["extra_data_str"],)
+            now = time.monotonic()
+            if now - _recent.get(key, -DEDUPE_SECONDS) < DEDUPE_SECONDS:
+                return False
+            _recent[key] = now
+
+        _journal_file.write(_dump_row(row) + "\n")
+        _journal_file.flush()
+
+    _queue.put(row)
+    if _queue.qsize() >= FLUSH_SIZE:
+        _wakeup.set()
+    return True
+
+
+def _drain() -> Tuple[List[dict], List[str]]:
+    """대기열을 비우고, 그동안의 저널 조각을 넘긴다(조각은 지울 때까지 잠가 둔다)"""
+    with _journal_lock:
+        rows = []
+        while True:
+            try:
+                rows.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not rows:
+            return rows, []
+
+        segments = list(_journal_segments)
+        _journal_segments.clear()
+        _open_journal()
+
+        now = time.monotonic()
+        for key in [key for key, created in _recent.items() if now - created >= DEDUPE_SECONDS]:
+            del _recent[key]
+    return rows, segments
+
+
+def _insert(rows: List[dict]):
+    with _app.app_context():
+        try:
+            db.session.execute(insert(Log.__table__), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def _remove_segments(segments: List[str]):
+    for segment_path in segments:
+        try:
+            os.remove(segment_path)
+        except OSError:
+            pass
+        with _journal_lock:
+            journal_file = _journal_held.pop(segment_path, None)
+        if journal_file is not None:
+            journal_file.close()
+
+
+def _is_row_error(e: Exception) -> bool:
+    """연결 문제가 아닌 행 자체의 문제(다시 시도해도 실패한다)인지"""
+    if isinstance(e, (IntegrityError, DataError,)):
+        return True
+    return isinstance(e, StatementError) and not isinstance(e, DBAPIError)
+
+
+def _db_available() -> bool:
+    with _app.app_context():
+        try:
+            db.session.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+        finally:
+            db.session.rollback()
+
+
+def _insert_bisect(rows: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """rows 를 나눠 가며 기록하고 (혼자서도 실패한 행, DB 에 연결되지 않아 기록하지 못한 행)을 반환한다"""
+    dead = []
+    stack = [rows]
+    while stack:
+        chunk = stack.pop()
+        try:
+            _insert(chunk)
+        except Exception as e:
+            if not _is_row_error(e) and not _db_available():
+                print(e)
+                return dead, [row for pending in (chunk, *reversed(stack)) for row in pending]
+            if len(chunk) == 1:
+                print(f"dead letter: {e}")
+                dead.extend(chunk)
+            else:
+                middle = len(chunk) // 2
+                stack.append(chunk[middle:])
+                stack.append(chunk[:middle])
+    return dead, []
+
+
+def _write_dead_letter(rows: List[dict]):
+    if not rows:
+        return
+    with _journal_lock, open(DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(_dump_row(row) + "\n")
+
+
+def _requeue(rows: List[dict], segments: List[str]):
+    with _journal_lock:
+        _journal_segments[:0] = segments
+    for row in rows:
+        _queue.put(row)
+
+
+def flush():
+    """대기 중인 로그를 모두 기록한다(실패하면 다음 번에 다시 시도)"""
+    global _failures
+    rows, segments = _drain()
+    if not rows:
+        return
+
+    try:
+        _insert(rows)
+    except Exception as e:
+        print(e)
+        _failures += 1
+        if not _is_row_error(e) and _failures < MAX_RETRY:
+            _requeue(rows, segments)
+            return
+
+        dead, rows = _insert_bisect(rows)
+        _write_dead_letter(dead)
+        if rows:
+            _requeue(rows, segments)
+            return
+
+    _failures = 0
+    _remove_segments(segments)
+
+
+def _run():
+    next_replay = time.monotonic() + REPLAY_INTERVAL
+    while True:
+        if _failures:
+            time.sleep(min(FLUSH_INTERVAL * 2 ** min(_failures, 16), RETRY_MAX_DELAY))
+        else:
+            _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        flush()
+
+        if time.monotonic() >= next_replay:
+            next_replay = time.monotonic() + REPLAY_INTERVAL
+            try:
+                replay_journals()
+            except Exception as e:
+                print(e)
+
+
+def _load_rows(journal_file: IO) -> List[dict]:
+    rows = []
+    for line in journal_file:
+        if not line.strip():
+            continue
+        try:
+            rows.append(_load_row(line))
+        except ValueError as e:  # 쓰는 중에 죽어 잘린 줄
+            print(f"journal: {e!r}")
+    return rows
+
+
+def replay_journals():
+    """잠기지 않은(쓰던 프로세스가 죽은) 저널 조각을 다시 기록한다"""
+    segment_paths = glob(os.path.join(JOURNAL_PATH, "*.jsonl")) + glob(os.path.join(JOURNAL_PATH, "*.replay"))
+    for segment_path in segment_paths:
+        with _journal_lock:
+            if segment_path in _journal_held:
+                continue
+
+        try:
+            journal_file = open(segment_path, "r+", encoding="utf-8")
+        except OSError:
+            continue
+
+        with journal_file:
+            try:
+                fcntl.flock(journal_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if os.stat(segment_path).st_ino != os.fstat(journal_file.fileno()).st_ino:
+                    continue  # 잠그는 사이에 다른 프로세스가 기록하고 지움
+            except OSError:  # 살아 있는 프로세스가 쓰는 중이거나 이미 지워짐
+                continue
+
+            rows = _load_rows(journal_file)
+            dead, rows = _insert_bisect(rows) if rows else ([], [])
+            _write_dead_letter(dead)
+            if rows:  # DB 에 연결되지 않으면 남은 행만 두고 다음에 다시 기록한다
+                journal_file.seek(0)
+                journal_file.truncate()
+                journal_file.writelines(_dump_row(row) + "\n" for row in rows)
+                return
+            os.remove(segment_path)
+
+
+def init_app(app: Flask):
+    global _app
+    _app = app
+
+    global FLUSH_INTERVAL, FLUSH_SIZE, DEDUPE_SECONDS, MAX_RETRY
+    FLUSH_INTERVAL = app.config.get("LOG_WRITER_INTERVAL", FLUSH_INTERVAL)
+    FLUSH_SIZE = app.config.get("LOG_WRITER_SIZE", FLUSH_SIZE)
+    DEDUPE_SECONDS = app.config.get("LOG_WRITER_DEDUPE_SECONDS", DEDUPE_SECONDS)
+    MAX_RETRY = app.config.get("LOG_WRITER_MAX_RETRY", MAX_RETRY)
+
+    global REPLAY_INTERVAL
+    REPLAY_INTERVAL = app.config.get("LOG_JOURNAL_REPLAY_INTERVAL", REPLAY_INTERVAL)
+
+    global JOURNAL_PATH, DEAD_LETTER_PATH
+    JOURNAL_PATH = app.config.get("LOG_JOURNAL_PATH", os.path.join(app.instance_path, "log_journal"))
+    os.makedirs(JOURNAL_PATH, exist_ok=True)
+    DEAD_LETTER_PATH = app.config.get("LOG_DEAD_LETTER_PATH", os.path.join(app.instance_path, "log_dead_letter.jsonl"))
+
+    try:
+        replay_journals()
+    except Exception as e:
+        print(e)
+
+    atexit.register(flush)
@@ -0,0 +1,237 @@
+"""회원권 일괄 인쇄
+
+회원권을 프로세스 풀에서 그려 A4 인쇄용 PDF 또는 ZIP 으로 묶는다.
+작업 상태는 작업 폴더의 `status.json` 에 기록되므로 어느 워커에서든 조회할 수 있다.
+"""
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Tuple, List, Dict, Optional
+
+from PIL import Image, ImageFont
+
+from .qr_img import draw_membership_image, _load_background
+from .utils import stream_zip
+
+JOB_PATH: str = ""
+JOB_EXPIRE = 24 * 60 * 60
+
+OUTPUT_A4 = "a4"
+OUTPUT_ZIP = "zip"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SHEET_DPI = 300
+SHEET_SIZE = (2480, 3508,)  # A4 (210mm x 297mm)
+CARD_SIZE = (1011, 638,)  # 카드 (85.6mm x 54mm)
+SHEET_COLUMNS = 2
+SHEET_ROWS = 5
+CARDS_PER_SHEET = SHEET_COLUMNS * SHEET_ROWS
+ZIP_CHUNK = 32
+
+PATTERN_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class Card(NamedTuple):
+    """인쇄할 회원권 정보(프로세스 풀로 넘길 수 있도록 값만 담는다)"""
+    user_id: int
+    revision: int
+    skey: str
+    background_path: str
+    qr_box: Tuple[int, int, int, int]
+    text_location: Tuple[int, int]
+    payload: Optional[str] = None
+
+
+_status_lock = threading.Lock()
+_worker_fonts: Dict[str, ImageFont.FreeTypeFont] = {}
+
+
+def _get_worker_font(font_path: str) -> Optional[ImageFont.FreeTypeFont]:
+    font = _worker_fonts.get(font_path)
+    if font is None:
+        try:
+            font = ImageFont.truetype(font_path, 45)
+        except IOError as ioe:
+            print(ioe)
+            return None
+        _worker_fonts[font_path] = font
+    return font
+
+
+def _render_card(card: Card, font: Optional[ImageFont.FreeTypeFont]) -> Image.Image:
+    background = _load_background(card.background_path) if font is not None else None
+    return draw_membership_image(
+        card.user_id, card.revision, card.skey, background, card.qr_box, card.text_location, font, card.payload
+    )
+
+
+def render_card_files(cards: List[Card], job_path: str, font_path: str) -> List[Tuple[str, str]]:
+    """회원권을 각각 PNG 로 저장한다(프로세스 풀에서 실행)"""
+    font = _get_worker_font(font_path)
+    files = []
+    for card in cards:
+        file_name = f"{card.user_id}.png"
+        file_path = os.path.join(job_path, file_name)
+        _render_card(card, font).save(file_path, "PNG")
+        files.append((file_name, file_path,))
+    return files
+
+
+def render_sheet_file(cards: List[Card], sheet_path: str, font_path: str) -> str:
+    """회원권을 A4 한 장에 배치해 PNG 로 저장한다(프로세스 풀에서 실행)"""
+    font = _get_worker_font(font_path)
+    sheet = Image.new("RGB", SHEET_SIZE, "white")
+
+    gap_x = (SHEET_SIZE[0] - CARD_SIZE[0] * SHEET_COLUMNS) // (SHEET_COLUMNS + 1)
+    gap_y = (SHEET_SIZE[1] - CARD_SIZE[1] * SHEET_ROWS) // (SHEET_ROWS + 1)
+
+    for i, card in enumerate(cards):
+        img = _render_card(card, font).convert("RGB")
+        scale = min(CARD_SIZE[0] / img.width, CARD_SIZE[1] / img.height)
+        img = img.resize((int(img.width * scale), int(img.height * scale),))
+
+        col, row = i % SHEET_COLUMNS, i // SHEET_COLUMNS
+        x = gap_x + col * (CARD_SIZE[0] + gap_x) + (CARD_SIZE[0] - img.width) // 2
+        y = gap_y + row * (CARD_SIZE[1] + gap_y) + (CARD_SIZE[1] - img.height) // 2
+        sheet.paste(img, (x, y,))
+
+    sheet.save(sheet_path, "PNG")
+    return sheet_path
+
+
+def _get_job_path(job_id: str) -> str:
+    return os.path.join(JOB_PATH, job_id)
+
+
+def _write_status(job_id: str, **kwargs) -> dict:
+    with _status_lock:
+        status = get_job_status(job_id) or {"job_id": job_id}
+        status.update(kwargs)
+
+        status_path = os.path.join(_get_job_path(job_id), "status.json")
+        temp_path = f"{status_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(status, f, ensure_ascii=False)
+        os.replace(temp_path, status_path)
+    return status
+
+
+def get_job_status(job_id: str) -> Optional[dict]:
+    """작업 상태를 반환한다(없으면 None)"""
+    if not PATTERN_JOB_ID.match(job_id):
+        return None
+    try:
+        with open(os.path.join(_get_job_path(job_id), "status.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_job_output_path(job_id: str) -> Optional[str]:
+    """완료된 작업의 결과 파일 경로를 반환한다(없으면 None)"""
+    status = get_job_status(job_id)
+    if not status or status.get("status") != STATUS_DONE:
+        return None
+    return os.path.join(_get_job_path(job_id), status["file_name"])
+
+
+def _remove_expired_jobs():
+    now = time.time()
+    for job_id in os.listdir(JOB_PATH):
+        job_path = _get_job_path(job_id)
+        try:
+            if now - os.path.getmtime(job_path) > JOB_EXPIRE:
+                shutil.rmtree(job_path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def _chunks(cards: List[Card], size: int) -> List[List[Card]]:
+    return [cards[i:i + size] for i in range(0, len(cards), size)]
+
+
+def _run_job(job_id: str, cards: List[Card], output: str, font_path: str, workers: int):
+    job_path = _get_job_path(job_id)
+    temp_files = []
+    try:
+        _write_status(job_id, status=STATUS_RUNNING)
+
+        chunk_size = CARDS_PER_SHEET if output == OUTPUT_A4 else ZIP_CHUNK
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            if output == OUTPUT_A4:
+                futures = [
+                    (executor.submit(
+                        render_sheet_file, chunk, os.path.join(job_path, f"sheet-{i:04d}.png"), font_path
+                    ), len(chunk),)
+                    for i, chunk in enumerate(_chunks(cards, chunk_size))
+                ]
+            else:
+                futures = [
+                    (executor.submit(render_card_files, chunk, job_path, font_path), len(chunk),)
+                    for chunk in _chunks(cards, chunk_size)
+                ]
+
+            done = 0
+            results = []
+            for future, count in futures:
+                results.append(future.result())
+                done += count
+                _write_status(job_id, done=done)
+
+        if output == OUTPUT_A4:
+            temp_files.extend(results)
+            file_name = "membership.pdf"
+            file_path = os.path.join(job_path, file_name)
+            for i, sheet_path in enumerate(results):
+                with Image.open(sheet_path) as sheet:
+                    sheet.save(file_path, "PDF", resolution=SHEET_DPI, append=i > 0)
+        else:
+            files = [file for result in results for file in result]
+            temp_files.extend(file_path for _, file_path in files)
+            file_name = "membership.zip"
+            with open(os.path.join(job_path, file_name), "wb") as f:
+                for chunk in stream_zip(files):
+                    f.write(chunk)
+
+        _write_status(job_id, status=STATUS_DONE, file_name=file_name)
+
+    except Exception as e:
+        print(e)
+        _write_status(job_id, status=STATUS_FAILED, message=str(e))
+
+    finally:
+        for file_path in temp_files:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+
+def start_job(cards: List[Card], output: str, font_path: str, workers: int) -> dict:
+    """회원권 일괄 생성 작업을 시작하고 작업 상태를 반환한다"""
+    _remove_expired_jobs()
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(_get_job_path(job_id))
+    status = _write_status(job_id, status=STATUS_QUEUED, output=output, total=len(cards), done=0)
+
+    threading.Thread(
+        target=_run_job, args=(job_id, cards, output, font_path, workers,), daemon=True
+    ).start()
+    return status
+
+
+def init_app(app):
+    global JOB_PATH
+    JOB_PATH = app.config.get("MEMBERSHIP_JOB_PATH", os.path.join(app.instance_path, "membership_job"))
+    os.makedirs(JOB_PATH, exist_ok=True)
@@ -0,0 +1,83 @@
+"""전화번호 검색용 색인(`user.num_index`)
+
+전화번호는 암호화되어 있어 DB 에서 바로 찾을 수 없으므로 HMAC 색인을 함께 저장하고 그 값으로 찾는다.
+새로 저장하는 번호는 `User.num` 에서 채우고, 기존 사용자는 `flask backfill-num-index` 로 채운다.
+"""
+from typing import Optional
+
+import click
+from flask import Flask
+from sqlalchemy import inspect, text, update
+
+from StudyRoomManagementServer.model import User, db
+from StudyRoomManagementServer.security import blind_index_v1, dec_v1
+
+BACKFILL_BATCH = 500
+
+
+def ensure_column() -> None:
+    """create_all 은 기존 테이블에 컬럼을 추가하지 않으므로 없으면 직접 추가한다"""
+    table = User.__table__
+    column = table.c.num_index
+    if column.name in {c["name"] for c in inspect(db.engine).get_columns(table.name)}:
+        return
+
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            f"ALTER TABLE {preparer.format_table(table)} "
+            f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=db.engine.dialect)}"
+        ))
+        for index in table.indexes:
+            if column in index.columns.values():
+                index.create(connection)
+
+
+def backfill(rebuild: bool = False, batch_size: int = BACKFILL_BATCH) -> int:
+    """색인이 없는 사용자(rebuild 이면 전체)의 색인을 채우고 채운 수를 반환한다"""
+    count = 0
+    last_id = 0
+    while True:
+        query = db.session.query(User.id, User.encrypted_num)\
+            .filter(User.id > last_id)\
+            .filter(User.encrypted_num.isnot(None))
+        if not rebuild:
+            query = query.filter(User.num_index.is_(None))
+        rows = query.order_by(User.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        values = []
+        for user_id, encrypted_num in rows:
+            try:
+                values.append({"id": user_id, "num_index": blind_index_v1(dec_v1(encrypted_num))})
+            except ValueError as e:
+                print(f"user_id={user_id}, e={e!r}")
+        if values:
+            db.session.execute(update(User), values)
+            db.session.commit()
+        count += len(values)
+    return count
+
+
+def get_user_by_num(num: str) -> Optional[User]:
+    """전화번호로 사용자를 찾는다('-' 유무는 상관없다)"""
+    num_index = blind_index_v1(num)
+    if num_index is None:
+        return None
+    return User.query.filter_by(num_index=num_index).order_by(User.id.desc()).first()
+
+
+def init_app(app: Flask):
+    with app.app_context():
+        try:
+            ensure_column()
+        except Exception as e:
+            print(e)
+
+    @app.cli.command("backfill-num-index")
+    @click.option("--rebuild", is_flag=True, help="색인 키를 바꾼 경우 전체를 다시 계산")
+    def backfill_num_index(rebuild: bool):
+        """기존 사용자의 전화번호 색인을 채운다"""
+        click.echo(f"{backfill(rebuild)} users")
@@ -0,0 +1,76 @@
+"""OTP 저장소
+
+발급한 OTP 는 DB 의 `otp` 테이블에 사용자별로 하나씩 저장하므로 어느 워커에서든 확인할 수 있다.
+코드에 유일 인덱스가 있어 코드로 바로 찾고, 만료된 OTP 는 발급할 때 지운다.
+"""
+import datetime as dt
+from random import choice
+from string import digits
+from typing import NamedTuple, Optional
+
+from flask import Flask
+from sqlalchemy.exc import IntegrityError
+
+from StudyRoomManagementServer.model import Otp, db
+
+OTP_LENGTH = 6
+OTP_EXPIRE = dt.timedelta(minutes=10)
+OTP_ISSUE_RETRY = 5
+
+
+class OtpResult(NamedTuple):
+    """사용한 OTP 정보"""
+    user_id: int
+    created: dt.datetime
+
+    @property
+    def expired(self) -> bool:
+        return (self.created + OTP_EXPIRE) <= dt.datetime.utcnow()
+
+
+def get_new_otp() -> str:
+    new_otp = "".join([choice(digits) for _ in range(OTP_LENGTH)])
+    return new_otp
+
+
+def remove_expired_otp() -> None:
+    Otp.query.filter(Otp.created <= dt.datetime.utcnow() - OTP_EXPIRE).delete(synchronize_session=False)
+
+
+def issue_otp(user_id: int) -> str:
+    """사용자의 OTP 를 새로 발급한다(기존 OTP 는 폐기, 다른 사용자와 겹치면 다시 만든다)"""
+    for _ in range(OTP_ISSUE_RETRY):
+        otp_code = get_new_otp()
+        try:
+            remove_expired_otp()
+            Otp.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+            db.session.add(Otp(user_id=user_id, otp_code=otp_code, created=dt.datetime.utcnow()))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            continue
+        return otp_code
+
+    raise RuntimeError("OTP 발급 실패")
+
+
+def consume_otp(otp_code: str) -> Optional[OtpResult]:
+    """OTP 를 사용 처리하고 발급 정보를 반환한다(없거나 다른 워커가 먼저 사용했으면 None)
+
+    만료 여부는 호출한 쪽에서 `OtpResult.expired` 로 확인한다.
+    """
+    otp = Otp.query.filter_by(otp_code=otp_code).first()
+    if otp is None:
+        return None
+
+    result = OtpResult(otp.user_id, otp.created)
+    deleted = Otp.query.filter_by(user_id=result.user_id, otp_code=otp_code).delete(synchronize_session=False)
+    db.session.commit()
+    if not deleted:
+        return None
+    return result
+
+
+def init_app(app: Flask):
+    global OTP_EXPIRE
+    OTP_EXPIRE = dt.timedelta(seconds=app.config.get("OTP_EXPIRE_SECONDS", OTP_EXPIRE.total_seconds()))
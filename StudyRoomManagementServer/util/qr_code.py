@@ -1,6 +1,26 @@
-from typing import Tuple, NamedTuple
+import calendar
+import datetime as dt
+import hashlib
+import hmac
+import time
+from base64 import urlsafe_b64encode
+from typing import Tuple, NamedTuple, Dict, Optional, List, Union
 
-from StudyRoomManagementServer.model import User, QR
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import SQLAlchemyError
+
+from StudyRoomManagementServer.model import User, QR, db
+from StudyRoomManagementServer.util import table_version, user_cache
+from .grade import GRADE_NORMAL, GRADE_VIP, is_vip
+
+QR_CACHE_TTL = 30
+
+QR_SIGNED_PREFIX = "S"
+QR_SIGNATURE_LENGTH = 22
+QR_SIGNED_EXPIRE_DAYS = 365
+QR_REVOCATION_REFRESH = 60
+
+QR_SIGN_KEY: Optional[bytes] = None
 
 
 class QrResult(NamedTuple):
@@ -11,6 +31,155 @@ class QrResult(NamedTuple):
     user_key: str
 
 
+class SignedQrResult(NamedTuple):
+    """서명된 QR 분석 결과(리비전은 QR 발급 번호)"""
+    qr_code: str
+    revision: int
+    user_id: int
+    tier: int
+    expire: int
+    signature: str
+
+
+class _QrCacheEntry(NamedTuple):
+    """사용자별 최신 QR"""
+    expire: float
+    qr: dict
+
+
+_qr_cache: Dict[int, _QrCacheEntry] = {}
+
+
+def _snapshot(obj) -> dict:
+    return {key: getattr(obj, key) for key in obj.__mapper__.c.keys()}
+
+
+def _invalidate_qr(_mapper, _connection, target: QR) -> None:
+    _qr_cache.pop(target.user_id, None)
+
+
+_qr_cache_version = ""
+_revocations: Dict[int, int] = {}
+_revocations_expire = 0.0
+_revocations_version = ""
+
+
+def _revoke_previous_qr(_mapper, _connection, target: QR) -> None:
+    """새 QR 이 발급되면 그 전에 서명된 QR 은 폐기한다"""
+    if target.id is not None and _revocations.get(target.user_id, 0) < target.id:
+        _revocations[target.user_id] = target.id
+
+
+def evict_qr(user_id: int, qr_id: int) -> None:
+    """재발급한 사용자의 캐시를 지우고 qr_id 이전에 서명된 QR 을 폐기한다"""
+    _qr_cache.pop(user_id, None)
+    if _revocations.get(user_id, 0) < qr_id:
+        _revocations[user_id] = qr_id
+
+
+def _refresh_revocations() -> None:
+    """폐기 목록(재발급된 사용자의 최신 발급 번호)을 주기적으로 또는 다른 워커에서 재발급하면 다시 읽는다
+
+    실패하면 기존 목록을 사용한다.
+    """
+    global _revocations, _revocations_expire, _revocations_version
+    version = table_version.get_version(QR.__tablename__)
+    if _revocations_expire > time.monotonic() and _revocations_version == version:
+        return
+    _revocations_expire = time.monotonic() + QR_REVOCATION_REFRESH
+    _revocations_version = version
+
+    try:
+        rows = db.session.query(QR.user_id, db.func.max(QR.id))\
+            .group_by(QR.user_id)\
+            .having(db.func.count(QR.id) > 1)\
+            .all()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return
+    _revocations = dict(rows)
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(QR, _event_name, _invalidate_qr)
+event.listen(QR, "after_insert", _revoke_previous_qr)
+table_version.watch(QR)
+
+
+def _get_qr_cache_entry(user_id: int) -> Optional[_QrCacheEntry]:
+    """캐시된 최신 QR 을 가져온다(없거나 만료되었거나 다른 워커에서 QR 이 바뀌었으면 DB 에서 읽는다)
+
+    사용자 정보는 user_cache 에서 읽는다.
+    """
+    global _qr_cache_version
+    version = table_version.get_version(QR.__tablename__)
+    if _qr_cache_version != version:
+        _qr_cache.clear()
+        _qr_cache_version = version
+
+    entry = _qr_cache.get(user_id)
+    if entry is not None and entry.expire > time.monotonic():
+        return entry
+
+    qr = QR.query.filter_by(user_id=user_id).order_by(QR.id.desc()).first()
+    if qr is None:
+        return None
+
+    entry = _QrCacheEntry(time.monotonic() + QR_CACHE_TTL, _snapshot(qr))
+    _qr_cache[user_id] = entry
+    return entry
+
+
+def _sign(user_id: int, revision: int, tier: int, expire: int) -> str:
+    message = f"{user_id}.{revision}.{tier}.{expire}".encode("utf-8")
+    digest = hmac.new(QR_SIGN_KEY, message, hashlib.sha256).digest()
+    return urlsafe_b64encode(digest).decode("ascii")[:QR_SIGNATURE_LENGTH]
+
+
+def create_qr_code(user: User, qr: QR) -> str:
+    """QR 에 담을 문자열을 만든다
+
+    QR_SIGN_KEY 가 있으면 `S{회원 번호}.{발급 번호}.{등급}.{만료}.{서명}` 형식(16진수)으로 서명해서
+    DB 없이 검증할 수 있게 하고, 없으면 기존 V1 형식을 사용한다.
+    """
+    if QR_SIGN_KEY is None:
+        return f"{qr.revision}0{user.id:04x}{qr.skey}"
+
+    tier = 1 if is_vip(user) else 0
+    created = qr.created if qr.created is not None else dt.datetime.utcnow()
+    expire = calendar.timegm(created.utctimetuple()) + QR_SIGNED_EXPIRE_DAYS * 24 * 60 * 60
+    signature = _sign(user.id, qr.id, tier, expire)
+    return f"{QR_SIGNED_PREFIX}{user.id:x}.{qr.id:x}.{tier}.{expire:x}.{signature}"
+
+
+def verify_signed_qr_code(qr_code: str) -> SignedQrResult:
+    """서명된 QR 검증(서명, 만료, 폐기 목록만 확인한다)
+
+    폐기 목록은 QR_REVOCATION_REFRESH 마다 DB 에서 다시 읽으며, 읽지 못하면 기존 목록을 사용한다.
+    """
+    if QR_SIGN_KEY is None:
+        raise ValueError("Wrong QR")
+
+    try:
+        user_id, revision, tier, expire, signature = qr_code[len(QR_SIGNED_PREFIX):].split(".")
+        user_id, revision, tier, expire = int(user_id, 16), int(revision, 16), int(tier), int(expire, 16)
+    except ValueError:
+        raise ValueError("Wrong QR")
+
+    if not hmac.compare_digest(signature.encode("utf-8"), _sign(user_id, revision, tier, expire).encode("utf-8")):
+        raise ValueError("Qr Auth Fail")
+
+    elif expire < time.time():
+        raise ValueError("Expired QR")
+
+    _refresh_revocations()
+    if _revocations.get(user_id, revision) > revision:
+        raise ValueError("Revoked QR")
+
+    return SignedQrResult(qr_code, revision, user_id, tier, expire, signature)
+
+
 def __parse_qr_code_v1(qr_code: str) -> QrResult:
     """V1 qr 분석"""
     revision, code = qr_code.split("0", 1)
@@ -20,7 +189,11 @@ def __parse_qr_code_v1(qr_code: str) -> QrResult:
 
 
 def parse_qr_code(qr_code: str) -> Tuple[int, int, str]:
-    """qr 분석"""
+    """qr 분석(서명된 QR 은 여기서 검증하고 (발급 번호, 회원 번호, 서명) 을 반환한다)"""
+    if qr_code.startswith(QR_SIGNED_PREFIX):
+        result = verify_signed_qr_code(qr_code)
+        return result.revision, result.user_id, result.signature
+
     try:
         _, revision, user_id, user_key = __parse_qr_code_v1(qr_code)
 
@@ -33,20 +206,132 @@ def parse_qr_code(qr_code: str) -> Tuple[int, int, str]:
     return revision, user_id, user_key
 
 
+def _parse(qr_code: str) -> Tuple[int, int, str, Optional[SignedQrResult]]:
+    """qr 분석((발급 번호, 회원 번호, 키 또는 서명, 서명된 QR 이면 검증 결과))"""
+    if qr_code.startswith(QR_SIGNED_PREFIX):
+        signed = verify_signed_qr_code(qr_code)
+        return signed.revision, signed.user_id, signed.signature, signed
+    return (*parse_qr_code(qr_code), None)
+
+
+def _offline_result(signed: SignedQrResult) -> Tuple[User, QR]:
+    """DB 를 읽지 못할 때 검증된 서명 내용으로 만든 결과
+
+    사용자 정보는 마지막으로 캐시된 값을 쓰고, 없으면 서명된 등급만 채운 사용자를 만든다.
+    """
+    user = user_cache.get_stale_user(signed.user_id)
+    if user is None:
+        user = User(id=signed.user_id, grade=GRADE_VIP if signed.tier else GRADE_NORMAL, sms=1)
+    created = dt.datetime.utcfromtimestamp(signed.expire - QR_SIGNED_EXPIRE_DAYS * 24 * 60 * 60)
+    return user, QR(id=signed.revision, user_id=signed.user_id, created=created)
+
+
+def _check(
+        revision: int, user_key: str, signed: Optional[SignedQrResult], user: Optional[User], qr: Optional[QR]
+) -> Union[Tuple[User, QR], ValueError]:
+    if qr is None or user is None:  # check exist
+        return ValueError("Not Member")
+
+    elif signed is not None:
+        if qr.id != revision:
+            return ValueError("Revoked QR")
+
+    elif not hmac.compare_digest(user_key.encode("utf-8"), qr.skey.encode("utf-8")):
+        return ValueError("Qr Auth Fail")
+
+    return user, qr
+
+
 def get_user_from_qr_code(qr_code: str) -> Tuple[User, QR]:
-    """QR 코드에서 사용자 추출"""
-    _, user_id, user_key = parse_qr_code(qr_code)
+    """QR 코드에서 사용자 추출
+
+    최신 QR 은 QR_CACHE_TTL 초 동안, 사용자는 user_cache 에 캐시한다.
+    DB 를 읽지 못하면 서명된 QR 은 서명, 만료와 마지막으로 읽은 폐기 목록만으로 인증한다(`_offline_result`).
+    """
+    revision, user_id, user_key, signed = _parse(qr_code)
 
     try:
-        qr = QR.query.filter_by(user_id=user_id).order_by(QR.id.desc()).first()
-    except Exception as e:  # check uid
+        entry = _get_qr_cache_entry(user_id)
+        user = user_cache.get_user(user_id) if entry is not None else None
+    except SQLAlchemyError as e:
         print(e)
-        raise ValueError from e
+        db.session.rollback()
+        if signed is None:
+            raise ValueError from e
+        return _offline_result(signed)
 
-    if qr is None:  # check exist
-        return ValueError("Not Member")
+    result = _check(revision, user_key, signed, user, QR(**entry.qr) if entry is not None else None)
+    if isinstance(result, ValueError):
+        raise result
+    return result
 
-    elif user_key != qr.skey:
-        return ValueError("Qr Auth Fail")
 
-    return User.query.filter_by(id=user_id).first(), qr
+def get_users_from_qr_codes(qr_codes: List[str]) -> List[Union[Tuple[User, QR], ValueError]]:
+    """여러 QR 코드에서 사용자 추출
+
+    회원 번호를 모아 최신 QR 과 사용자를 한번씩만 조회하며, 실패한 항목은 ValueError 로 반환한다.
+    DB 를 읽지 못하면 서명된 QR 은 `get_user_from_qr_code` 와 같이 서명만으로 인증한다.
+    """
+    parsed = []
+    for qr_code in qr_codes:
+        try:
+            parsed.append(_parse(qr_code))
+        except ValueError as ve:
+            parsed.append(ve)
+
+    user_ids = {result[1] for result in parsed if not isinstance(result, ValueError)}
+    offline = False
+    qrs, users = {}, {}
+    if user_ids:
+        try:
+            latest_ids = db.select(db.func.max(QR.id)).where(QR.user_id.in_(user_ids)).group_by(QR.user_id)
+            qrs = {qr.user_id: qr for qr in QR.query.filter(QR.id.in_(latest_ids)).all()}
+            users = user_cache.get_users(user_ids)
+        except SQLAlchemyError as e:
+            print(e)
+            db.session.rollback()
+            offline = True
+
+    results = []
+    for result in parsed:
+        if isinstance(result, ValueError):
+            results.append(result)
+            continue
+
+        revision, user_id, user_key, signed = result
+        if not offline:
+            results.append(_check(revision, user_key, signed, users.get(user_id), qrs.get(user_id)))
+        elif signed is not None:
+            results.append(_offline_result(signed))
+        else:
+            results.append(ValueError("Not Available"))
+    return results
+
+
+def ensure_index() -> None:
+    """create_all 은 기존 테이블에 색인을 추가하지 않으므로 최신 QR 조회용 `qr.user_id` 색인이 없으면 만든다"""
+    table = QR.__table__
+    column = table.c.user_id
+    indexes = inspect(db.engine).get_indexes(table.name)
+    if any(index["column_names"][:1] == [column.name] for index in indexes):
+        return
+
+    with db.engine.begin() as connection:
+        for index in table.indexes:
+            if list(index.columns.values()) == [column]:
+                index.create(connection)
+
+
+def init_app(app):
+    with app.app_context():
+        try:
+            ensure_index()
+        except Exception as e:
+            print(e)
+
+    global QR_SIGN_KEY
+    sign_key = app.config.get("QR_SIGN_KEY")
+    QR_SIGN_KEY = sign_key.encode("utf-8") if isinstance(sign_key, str) else sign_key
+
+    global QR_SIGNED_EXPIRE_DAYS
+    QR_SIGNED_EXPIRE_DAYS = app.config.get("QR_SIGNED_EXPIRE_DAYS", QR_SIGNED_EXPIRE_DAYS)
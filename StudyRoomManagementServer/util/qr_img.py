@@ -1,6 +1,10 @@
+import hashlib
 import os
+import threading
+from glob import glob
 from io import BytesIO
 from traceback import print_stack
+from typing import Dict, NamedTuple, Optional, Tuple
 
 from PIL import Image
 from PIL import ImageDraw
@@ -12,62 +16,206 @@ from qrcode.image.base import BaseImage
 from StudyRoomManagementServer.cms_config import get_config
 from StudyRoomManagementServer.model import User, QR
 from .grade import is_vip
+from .qr_code import create_qr_code
+from .image_variant import remove_variants
 
 GRADE_VIP = 5
 
 __FONT_PATH = ""
+CACHE_PATH: str = ""
+_FONT: Optional[ImageFont.FreeTypeFont] = None
 
+ASSET_NORMAL = "normal"
+ASSET_VIP = "vip"
 
-def __create_membership_image(user_id, revision, code, background_img, qr_box, text_location) -> BytesIO:
-    """실제 QR 이미지 생성"""
+
+class MembershipAsset(NamedTuple):
+    """미리 읽어둔 회원권 배경과 위치 정보"""
+    key: tuple
+    path: str
+    background: Optional[Image.Image]
+    qr_box: Tuple[int, int, int, int]
+    text_location: Tuple[int, int]
+
+
+_assets: Dict[str, MembershipAsset] = {}
+_backgrounds: Dict[str, Tuple[int, Image.Image]] = {}
+_assets_lock = threading.Lock()
+
+
+def get_font_path() -> str:
+    return __FONT_PATH
+
+
+def _get_font() -> ImageFont.FreeTypeFont:
+    global _FONT
+    if _FONT is None:
+        _FONT = ImageFont.truetype(__FONT_PATH, 45)
+    return _FONT
+
+
+def _get_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_background(path: str, mtime: Optional[int] = None) -> Optional[Image.Image]:
+    """배경 이미지를 읽는다(파일이 바뀌지 않았으면 읽어둔 것을 사용)"""
+    if mtime is None:
+        mtime = _get_mtime(path)
+    if mtime is None:
+        return None
+
+    with _assets_lock:
+        cached = _backgrounds.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+    try:
+        img = Image.open(path)
+        img.load()
+    except IOError as ioe:
+        print(ioe)
+        return None
+
+    with _assets_lock:
+        _backgrounds[path] = (mtime, img,)
+    return img
+
+
+def get_membership_asset(kind: str) -> MembershipAsset:
+    """회원권 배경을 가져온다(user_membership_* 설정이나 파일이 바뀌면 다시 읽는다)"""
+    config = get_config()
+    if kind == ASSET_VIP:
+        file_name = config.user_membership_vip_file
+        default_file_name = "vip_membership_bg.png"
+        qr_box = config.user_membership_vip_qr_box
+        text_location = config.user_membership_vip_text_box
+    else:
+        file_name = config.user_membership_normal_file
+        default_file_name = "membership_bg.png"
+        qr_box = config.user_membership_normal_qr_box
+        text_location = config.user_membership_normal_text_box
+
+    if file_name:
+        path = os.path.join(current_app.config["INSTANCE"], file_name)
+    else:
+        path = os.path.join(current_app.root_path, "static", "img", default_file_name)
+
+    mtime = _get_mtime(path)
+    key = (path, mtime, qr_box, text_location,)
+
+    asset = _assets.get(kind)
+    if asset is None or asset.key != key:
+        asset = MembershipAsset(key, path, _load_background(path, mtime), qr_box, text_location)
+        with _assets_lock:
+            _assets[kind] = asset
+    return asset
+
+
+def draw_membership_image(user_id, revision, code, background: Optional[Image.Image], qr_box, text_location,
+                          font: ImageFont.FreeTypeFont, payload: Optional[str] = None) -> Image.Image:
+    """배경 복사본에 QR 과 회원 번호를 그린다(배경이 없으면 QR 만 반환)
+
+    payload 가 없으면 V1 형식으로 QR 내용을 만든다.
+    """
     qr = QRCode()
-    qr.add_data(f"{revision}0{user_id:04x}{code}")
+    qr.add_data(payload if payload is not None else f"{revision}0{user_id:04x}{code}")
     qr.make()
 
     img_qr = qr.make_image(image_factory=PilImage)
 
-    bio = BytesIO()
-    bio.name = "membership.png"
     try:
-        img_qr = img_qr.resize((qr_box[2] - qr_box[0], qr_box[3] - qr_box[1],))
-        font = ImageFont.truetype(__FONT_PATH, 45)
+        if background is None:
+            raise IOError("No membership background")
 
-        with Image.open(background_img) as img_bg:
-            img_bg.paste(img_qr, qr_box)
+        img_bg = background.copy()
+        img_bg.paste(img_qr.resize((qr_box[2] - qr_box[0], qr_box[3] - qr_box[1],)), qr_box)
 
-            draw = ImageDraw.Draw(img_bg)
-            draw.text(text_location, f"V{revision}_{user_id}", (255, 255, 255), font)
-            img_bg.save(bio, "PNG")
+        draw = ImageDraw.Draw(img_bg)
+        draw.text(text_location, f"V{revision}_{user_id}", (255, 255, 255), font)
+        return img_bg
 
     except IOError as ioe:
         print(ioe)
         print_stack()
-        img_qr.save(bio, "PNG")
+        return img_qr.get_image()
+
+
+def _compose_membership_image(user_id, revision, code, background: Optional[Image.Image], qr_box, text_location,
+                              payload: Optional[str] = None) -> BytesIO:
+    bio = BytesIO()
+    bio.name = "membership.png"
+    try:
+        font = _get_font()
+    except IOError as ioe:
+        print(ioe)
+        background = None
+        font = None
+    draw_membership_image(user_id, revision, code, background, qr_box, text_location, font, payload).save(bio, "PNG")
     bio.seek(0)
     return bio
 
 
-def __create_normal_membership_image(user_id, revision, code) -> BytesIO:
-    """일반 회원권 생성"""
+def __create_membership_image(user_id, revision, code, background_img, qr_box, text_location) -> BytesIO:
+    """실제 QR 이미지 생성"""
+    background = _load_background(background_img)
+    return _compose_membership_image(user_id, revision, code, background, qr_box, text_location)
 
-    if get_config().user_membership_normal_file:
-        qr_img_path = os.path.join(current_app.config["INSTANCE"], get_config().user_membership_normal_file)
-    else:
-        qr_img_path = os.path.join(current_app.root_path, "static", "img",  "membership_bg.png")
-    qr_box = get_config().user_membership_normal_qr_box
-    text_location = get_config().user_membership_normal_text_box
-    return __create_membership_image(user_id, revision, code, qr_img_path, qr_box, text_location)
+
+def __create_normal_membership_image(user_id, revision, code, payload: Optional[str] = None) -> BytesIO:
+    """일반 회원권 생성"""
+    asset = get_membership_asset(ASSET_NORMAL)
+    return _compose_membership_image(
+        user_id, revision, code, asset.background, asset.qr_box, asset.text_location, payload
+    )
 
 
-def __create_vip_membership_image(user_id, revision, code) -> BytesIO:
+def __create_vip_membership_image(user_id, revision, code, payload: Optional[str] = None) -> BytesIO:
     """특별 회원 회원권 생성"""
-    if get_config().user_membership_vip_file:
-        qr_img_path = os.path.join(current_app.config["INSTANCE"], get_config().user_membership_vip_file)
-    else:
-        qr_img_path = os.path.join(current_app.root_path, "static", "img",  "vip_membership_bg.png")
-    qr_box = get_config().user_membership_vip_qr_box
-    text_location = get_config().user_membership_vip_text_box
-    return __create_membership_image(user_id, revision, code, qr_img_path, qr_box, text_location)
+    asset = get_membership_asset(ASSET_VIP)
+    return _compose_membership_image(
+        user_id, revision, code, asset.background, asset.qr_box, asset.text_location, payload
+    )
+
+
+def get_asset_kind(user: User) -> str:
+    return ASSET_VIP if is_vip(user) else ASSET_NORMAL
+
+
+def get_qr_image_hash(user: User, qr: QR) -> str:
+    """회원권 이미지를 결정하는 값(회원, QR 리비전, 키, 등급, 배경)의 해시"""
+    kind = get_asset_kind(user)
+    asset = get_membership_asset(kind)
+    key = f"{user.id}:{qr.revision}:{qr.skey}:{create_qr_code(user, qr)}:{kind}:{asset.key!r}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_qr_image_path(user: User, qr: QR) -> Tuple[str, str]:
+    """캐시된 회원권 이미지 경로와 해시를 반환한다(없으면 생성)
+
+    파일 이름은 `{회원 번호}-{해시}.png` 이므로 QR 재발급, 등급 변경, 배경 변경이 있을 때만 다시 그린다.
+    """
+    image_hash = get_qr_image_hash(user, qr)
+    file_path = os.path.join(CACHE_PATH, f"{user.id}-{image_hash}.png")
+    if os.path.isfile(file_path):
+        return file_path, image_hash
+
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(create_qr_image(user, qr).getbuffer())
+    os.replace(temp_path, file_path)
+
+    for old_path in glob(os.path.join(CACHE_PATH, f"{user.id}-*.png")):
+        if old_path != file_path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+            remove_variants(old_path)
+    return file_path, image_hash
 
 
 def create_qr_image(user: User, qr: QR) -> BytesIO:
@@ -76,11 +224,12 @@ def create_qr_image(user: User, qr: QR) -> BytesIO:
     user_id: int = user.id
     revision: int = qr.revision
     code: str = qr.skey
+    payload = create_qr_code(user, qr)
 
     if is_vip(user):
-        return __create_vip_membership_image(user_id, revision, code)
+        return __create_vip_membership_image(user_id, revision, code, payload)
 
-    return __create_normal_membership_image(user_id, revision, code)
+    return __create_normal_membership_image(user_id, revision, code, payload)
 
 
 class PilImage(BaseImage):
@@ -130,3 +279,13 @@ class PilImage(BaseImage):
 def init_app(app):
     global __FONT_PATH
     __FONT_PATH = os.path.join(app.root_path, "static", "font", "NanumBarunpenB.ttf")
+
+    global _FONT
+    try:
+        _FONT = ImageFont.truetype(__FONT_PATH, 45)
+    except IOError as ioe:
+        print(ioe)
+
+    global CACHE_PATH
+    CACHE_PATH = app.config.get("MEMBERSHIP_CACHE_PATH", os.path.join(app.instance_path, "membership"))
+    os.makedirs(CACHE_PATH, exist_ok=True)
@@ -1,14 +1,22 @@
 """영수증 생성기"""
 import datetime as dt
+import hashlib
 import os
-from io import BytesIO
-from typing import NamedTuple, Tuple, Union, List
+import threading
+import unicodedata
+from glob import glob
+from typing import NamedTuple, Tuple, Union, List, Dict
 
 from PIL import Image, ImageDraw, ImageFont
 
+from .image_variant import remove_variants
+
 TITLE_FONT: ImageFont.FreeTypeFont  # = ImageFont.truetype("NotoSansKR-Bold.otf", size=20, encoding="utf-8")
 BODY_FONT: ImageFont.FreeTypeFont  # = ImageFont.truetype("NotoSansKR-Regular.otf", size=12, encoding="utf-8")
 WATERMARK_IMG: Image.Image  # = ImageFont.truetype("NotoSansKR-Regular.otf", size=12, encoding="utf-8")
+TITLE_METRICS: "FontMetrics"
+BODY_METRICS: "FontMetrics"
+CACHE_PATH: str = ""
 
 W_0 = 5
 W_1 = 119
@@ -16,7 +24,21 @@ W_2 = W_1 + 69
 W_3 = W_2 + 42
 W_4 = W_3 + 64
 WIDTH = W_4 + 5
-HEIGHT = 1000
+MARGIN_BOTTOM = 10
+LAYOUT_VERSION = 2
+
+ALIGN_LEFT = "left"
+ALIGN_RIGHT = "right"
+ALIGN_CENTER = "center"
+
+STYLE_TITLE = "title"
+STYLE_BODY = "body"
+
+TEXT_LINE_WIDTH = 42
+ESCPOS_LINE_WIDTH = 42
+ESCPOS_ENCODING = "cp949"
+ESC = b"\x1b"
+GS = b"\x1d"
 
 
 class Store(NamedTuple):
@@ -53,6 +75,22 @@ class Menu(NamedTuple):
     count: int
 
 
+class Cell(NamedTuple):
+    """영수증 한 칸
+
+    x 는 WIDTH 기준 위치로, 정렬에 따라 왼쪽 끝, 오른쪽 끝, 가운데를 뜻한다.
+    """
+    text: str
+    x: int
+    align: str = ALIGN_LEFT
+
+
+class Line(NamedTuple):
+    """영수증 한 줄(칸이 없으면 빈 줄)"""
+    cells: Tuple[Cell, ...] = ()
+    style: str = STYLE_BODY
+
+
 class Receipt(NamedTuple):
     """영수증 정보"""
     no: int
@@ -62,6 +100,34 @@ class Receipt(NamedTuple):
     payment: Union[None, CreditCard]
 
 
+class FontMetrics:
+    """글꼴별 글자 폭 캐시"""
+
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        self.font = font
+        ascent, descent = font.getmetrics()
+        self.line_height = ascent + descent
+        self._widths: Dict[str, float] = {}
+
+    def text_width(self, text: str) -> float:
+        widths = self._widths
+        total = 0.0
+        for c in text:
+            width = widths.get(c)
+            if width is None:
+                width = widths[c] = self.font.getlength(c)
+            total += width
+        return total
+
+
+class _PlacedText(NamedTuple):
+    """위치가 정해진 글자"""
+    x: float
+    y: int
+    text: str
+    font: ImageFont.FreeTypeFont
+
+
 def _change_image_size(max_width: int, max_height: int, image: Image.Image) -> Image.Image:
     width_ratio = max_width / image.size[0]
     height_ratio = max_height / image.size[1]
@@ -73,155 +139,181 @@ def _change_image_size(max_width: int, max_height: int, image: Image.Image) -> I
     return new_image
 
 
-def _draw_title(draw: ImageDraw, text: str, size: Tuple[int, int]) -> Tuple[int, int]:
-    """제목을 그려라"""
-    tw, th = draw.textsize(text, font=TITLE_FONT)
-    draw.text(((WIDTH - tw) / 2, size[1],), text, font=TITLE_FONT, fill="black")
-    return tw, th
-
-
-def _draw_text(draw: ImageDraw, text: str, size: Tuple[int, int], align_right: bool = False) -> Tuple[int, int]:
-    """텍스트를 그려라"""
-    tw, th = draw.textsize(text, font=BODY_FONT)
-    if align_right:
-        size = size[0] - tw, size[1]
-    draw.text(size, text, font=BODY_FONT, fill="black")
-    return tw, th
-
-
-def _draw_text_line(draw: ImageDraw, text: str, min_height: int) -> int:
-    """한줄 텍스트를 그려라"""
-    return _draw_text(draw, text, (W_0, min_height))[1]
-
-
-def _draw_blank_line(draw: ImageDraw, min_height: int) -> int:
-    """빈 줄을 그려라"""
-    return _draw_text(draw, " ", (W_0, min_height))[1]
-
-
-def _sum_size(min_width: int, min_height: int, size: Tuple[int, int]) -> Tuple[int, int]:
-    """사이즈 더하기"""
-    res_width, res_height = size
-    return min_width + res_width, min_height + res_height
-
+def _title_line(text: str) -> Line:
+    return Line((Cell(text, WIDTH // 2, ALIGN_CENTER),), STYLE_TITLE)
 
-def make_receipt_image_file(receipt: Receipt) -> BytesIO:
-    """영수증 이미지 파일을 생성한다"""
-    img = make_receipt_image(receipt)
-    bio = BytesIO()
-    bio.name = "receipt.png"
-    img.save(bio, "PNG")
-    bio.seek(0)
-    return bio
 
+def _text_line(text: str) -> Line:
+    return Line((Cell(text, W_0),))
 
-def _draw_payment_none(draw: ImageDraw, min_height: int) -> int:
-    """결제 정보가 없음을 그려라"""
-    min_width, min_height = _sum_size(0, min_height, _draw_title(draw, "결제 실패", (0, min_height)))
-    return min_height
 
+def _label_value_line(label: str, value: str, label_x: int = W_0, label_align: str = ALIGN_LEFT) -> Line:
+    return Line((Cell(label, label_x, label_align), Cell(value, W_4, ALIGN_RIGHT)))
 
-def _draw_store(draw: ImageDraw, store: Store, min_height: int) -> int:
-    """상점 정보를 그려라"""
-    min_height += _draw_text_line(draw, f"상호: {store.name}", min_height)
-    min_height += _draw_text_line(draw, f"주소: {store.address}", min_height)
-    min_height += _draw_text_line(draw, f"대표자: {store.representative}", min_height)
-    min_height += _draw_text_line(draw, f"사업자 번호: {store.business_license}", min_height)
-    return min_height
 
+def _store_lines(store: Store) -> List[Line]:
+    """상점 정보"""
+    return [
+        _text_line(f"상호: {store.name}"),
+        _text_line(f"주소: {store.address}"),
+        _text_line(f"대표자: {store.representative}"),
+        _text_line(f"사업자 번호: {store.business_license}"),
+    ]
 
-def _draw_payment_credit_card(draw: ImageDraw, payment: CreditCard, min_height: int) -> int:
-    """신용 승인 정보를 그려라"""
-    min_width, min_height = _sum_size(0, min_height, _draw_title(draw, "신용승인", (0, min_height)))
 
-    line_height = min_height
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "카드명칭", (W_0, line_height)))
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, payment.name, (W_4, line_height), True))
+def _payment_credit_card_lines(payment: CreditCard) -> List[Line]:
+    """신용 승인 정보"""
+    return [
+        _title_line("신용승인"),
+        _label_value_line("카드명칭", payment.name),
+        _label_value_line("카드번호", payment.number),
+        _label_value_line("할부기간", "일시불" if payment.installment == 0 else f"{payment.installment}"),
+        _label_value_line("승인번호", f"{payment.accept_number}"),
+        _label_value_line("매입사", f"{payment.purchase_company}"),
+    ]
 
-    line_height = min_height
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "카드번호", (W_0, line_height)))
-    min_width, min_height = _sum_size(0, line_height,
-                                      _draw_text(draw, payment.number, (W_4, line_height), True))
 
-    line_height = min_height
-    text = "일시불" if payment.installment == 0 else f"{payment.installment}"
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "할부기간", (W_0, line_height)))
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, text, (W_4, line_height), True))
-
-    line_height = min_height
-    text = f"{payment.accept_number}"
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "승인번호", (W_0, line_height)))
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, text, (W_4, line_height), True))
-
-    line_height = min_height
-    text = f"{payment.purchase_company}"
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "매입사", (W_0, line_height)))
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, text, (W_4, line_height), True))
-    return min_height
-
-
-def make_receipt_image(receipt: Receipt) -> Image:
-    """영수증 이미지를 생성한다"""
-    min_width = 0
-    min_height = 0
+def make_receipt_lines(receipt: Receipt) -> List[Line]:
+    """출력 형식과 무관한 영수증 구성을 만든다"""
     now_dt = (dt.datetime.utcnow() + dt.timedelta(hours=9)).strftime('%Y-%m-%d %H:%M')
 
-    img = Image.new(mode="RGBA", size=(WIDTH, HEIGHT,), color=(255, 255, 255))
-    draw = ImageDraw.Draw(img)
-
-    min_width, min_height = _sum_size(min_width, min_height, _draw_title(draw, "영수증", (min_width, min_height)))
-    min_height = _draw_store(draw, receipt.store, min_height)
-
-    min_height += _draw_text_line(draw, f"일시: {receipt.datetime.strftime('%Y년 %m월 %d일')}", min_height)
-    min_height += _draw_text_line(draw, f"발행일시: {now_dt}", min_height)
-    min_height += _draw_text_line(draw, f"No: {receipt.no}", min_height)
-
-    min_height += _draw_blank_line(draw, min_height)
-
-    line_height = min_height
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "메뉴명", (W_0, line_height)))
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "단가", (W_1, line_height)))
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "수량", (W_2, line_height)))
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, "금액", (W_3, line_height)))
+    lines = [_title_line("영수증")]
+    lines.extend(_store_lines(receipt.store))
+    lines.append(_text_line(f"일시: {receipt.datetime.strftime('%Y년 %m월 %d일')}"))
+    lines.append(_text_line(f"발행일시: {now_dt}"))
+    lines.append(_text_line(f"No: {receipt.no}"))
+    lines.append(Line())
 
+    lines.append(Line((Cell("메뉴명", W_0), Cell("단가", W_1), Cell("수량", W_2), Cell("금액", W_3))))
     for menu in receipt.menu:
-        line_height = min_height
-        _, _ = _sum_size(0, line_height, _draw_text(draw, menu.name, (W_0, line_height)))
-        _, _ = _sum_size(0, line_height, _draw_text(draw, format(menu.unit_price, ","), (W_2, line_height), True))
-        _, _ = _sum_size(0, line_height, _draw_text(draw, format(menu.count, ","), (W_3, line_height), True))
-        text = format(menu.unit_price * menu.count, ",")
-        min_width, min_height = _sum_size(0, line_height, _draw_text(draw, text, (W_4, line_height), True))
+        lines.append(Line((
+            Cell(menu.name, W_0),
+            Cell(format(menu.unit_price, ","), W_2, ALIGN_RIGHT),
+            Cell(format(menu.count, ","), W_3, ALIGN_RIGHT),
+            Cell(format(menu.unit_price * menu.count, ","), W_4, ALIGN_RIGHT),
+        )))
 
-    min_height += _draw_blank_line(draw, min_height)
-    min_height += _draw_blank_line(draw, min_height)
+    lines.append(Line())
+    lines.append(Line())
 
-    line_height = min_height
     total_price = sum([menu.unit_price * menu.count for menu in receipt.menu])
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "판매금액", (W_0, line_height)))
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, format(total_price, ","), (W_4, line_height), True))
-
-    line_height = min_height
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "과세공급가액", (W_3, line_height), True))
     tax_free_price = round(total_price / 1.1)
     tax = total_price - tax_free_price
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, format(tax_free_price, ","), (W_4, line_height), True))
+    lines.append(_label_value_line("판매금액", format(total_price, ",")))
+    lines.append(_label_value_line("과세공급가액", format(tax_free_price, ","), W_3, ALIGN_RIGHT))
+    lines.append(_label_value_line("부가세액", format(tax, ","), W_3, ALIGN_RIGHT))
+    lines.append(_label_value_line("총 결제 금액", format(total_price, ","), W_3, ALIGN_RIGHT))
 
-    line_height = min_height
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "부가세액", (W_3, line_height), True))
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, format(tax, ","), (W_4, line_height), True))
-
-    line_height = min_height
-    _, _ = _sum_size(0, line_height, _draw_text(draw, "총 결제 금액", (W_3, line_height), True))
-    min_width, min_height = _sum_size(0, line_height, _draw_text(draw, format(total_price, ","), (W_4, line_height), True))
-
-    min_height += _draw_blank_line(draw, min_height)
+    lines.append(Line())
 
     if isinstance(receipt.payment, CreditCard):
-        min_height = _draw_payment_credit_card(draw, receipt.payment, min_height)
+        lines.extend(_payment_credit_card_lines(receipt.payment))
     elif receipt.payment is None:
-        min_height = _draw_payment_none(draw, min_height)
+        lines.append(_title_line("결제 실패"))
+
+    return lines
+
+
+def _text_width(text: str) -> int:
+    """고정폭 출력에서의 글자 폭(한글 등 전각 문자는 2칸)"""
+    return sum(2 if unicodedata.east_asian_width(c) in ("W", "F") else 1 for c in text)
+
+
+def _render_text_line(line: Line, width: int) -> str:
+    """한 줄을 고정폭 텍스트로 변환한다"""
+    text = ""
+    for cell in line.cells:
+        position = round((cell.x - W_0) * width / (W_4 - W_0))
+        cell_width = _text_width(cell.text)
+        if cell.align == ALIGN_RIGHT:
+            start = position - cell_width
+        elif cell.align == ALIGN_CENTER:
+            start = position - cell_width // 2
+        else:
+            start = position
+
+        current = _text_width(text)
+        start = max(start, current + 1 if text else 0)
+        text += " " * (start - current) + cell.text
+    return text.rstrip()
+
+
+def render_receipt_text(receipt: Receipt, width: int = TEXT_LINE_WIDTH) -> str:
+    """영수증을 일반 텍스트로 출력한다"""
+    return "\n".join(_render_text_line(line, width) for line in make_receipt_lines(receipt)) + "\n"
+
+
+def render_receipt_escpos(receipt: Receipt, width: int = ESCPOS_LINE_WIDTH, encoding: str = ESCPOS_ENCODING) -> bytes:
+    """영수증을 ESC/POS 명령으로 출력한다"""
+    data = bytearray(ESC + b"@")
+    for line in make_receipt_lines(receipt):
+        if line.style == STYLE_TITLE:
+            text = " ".join(cell.text for cell in line.cells)
+            data += ESC + b"a\x01" + GS + b"!\x11"
+            data += text.encode(encoding, errors="replace") + b"\n"
+            data += GS + b"!\x00" + ESC + b"a\x00"
+        else:
+            data += _render_text_line(line, width).encode(encoding, errors="replace") + b"\n"
+    data += GS + b"V\x42\x03"
+    return bytes(data)
+
+
+def _layout_lines(lines: List[Line]) -> Tuple[List[_PlacedText], int]:
+    """글자 위치와 전체 높이를 계산한다"""
+    placed = []
+    min_height = 0
+    for line in lines:
+        metrics = TITLE_METRICS if line.style == STYLE_TITLE else BODY_METRICS
+        for cell in line.cells:
+            if cell.align == ALIGN_RIGHT:
+                x = cell.x - metrics.text_width(cell.text)
+            elif cell.align == ALIGN_CENTER:
+                x = cell.x - metrics.text_width(cell.text) / 2
+            else:
+                x = cell.x
+            placed.append(_PlacedText(x, min_height, cell.text, metrics.font))
+        min_height += metrics.line_height
+    return placed, min_height + MARGIN_BOTTOM
+
+
+def get_receipt_hash(receipt: Receipt) -> str:
+    """영수증 내용 해시"""
+    return hashlib.sha1(f"{LAYOUT_VERSION}{receipt!r}".encode("utf-8")).hexdigest()[:16]
+
+
+def get_receipt_image_path(receipt: Receipt) -> str:
+    """캐시된 영수증 이미지 경로를 반환한다(없으면 생성)
+
+    파일 이름은 `{지불 번호}-{내용 해시}.png` 이므로 내용이 같으면 다시 그리지 않는다.
+    """
+    file_path = os.path.join(CACHE_PATH, f"{receipt.no}-{get_receipt_hash(receipt)}.png")
+    if os.path.isfile(file_path):
+        return file_path
+
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    make_receipt_image(receipt).save(temp_path, "PNG")
+    os.replace(temp_path, file_path)
+
+    for old_path in glob(os.path.join(CACHE_PATH, f"{receipt.no}-*.png")):
+        if old_path != file_path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+            remove_variants(old_path)
+    return file_path
 
-    return img.crop((0, 0, WIDTH, min_height + 10))
+
+def make_receipt_image(receipt: Receipt) -> Image:
+    """영수증 이미지를 생성한다(흑백, 크기를 먼저 계산한 뒤 한번에 그린다)"""
+    placed, height = _layout_lines(make_receipt_lines(receipt))
+
+    img = Image.new(mode="L", size=(WIDTH, height,), color=255)
+    draw = ImageDraw.Draw(img)
+    for text in placed:
+        draw.text((text.x, text.y,), text.text, font=text.font, fill=0)
+
+    return img
 
 
 def init_app(app):
@@ -235,7 +327,17 @@ def init_app(app):
         os.path.join(app.root_path, "static", "font", "NotoSansKR-Regular.otf")
         , size=12, encoding="utf-8")
 
+    global TITLE_METRICS
+    TITLE_METRICS = FontMetrics(TITLE_FONT)
+
+    global BODY_METRICS
+    BODY_METRICS = FontMetrics(BODY_FONT)
+
     global WATERMARK_IMG
     WATERMARK_IMG = Image.open(
         os.path.join(app.root_path, "static", "img", "logo-plin.png")
     )
+
+    global CACHE_PATH
+    CACHE_PATH = app.config.get("RECEIPT_CACHE_PATH", os.path.join(app.instance_path, "receipt"))
+    os.makedirs(CACHE_PATH, exist_ok=True)
@@ -0,0 +1,164 @@
+"""모델 직렬화기
+
+모델 클래스마다 내보낼 필드 목록(컬럼 + 하이브리드 속성)과 변환 함수를 처음 사용할 때 한번만 만들어 두고,
+객체마다 다시 살펴보지 않고 그대로 dict 로 바꾼다.
+"""
+import datetime as dt
+from operator import attrgetter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.hybrid import hybrid_property
+
+
+def isoformat(value: Any) -> Any:
+    """날짜/시간을 ISO 형식 문자열로 바꾼다"""
+    return value.isoformat() if isinstance(value, (dt.date, dt.time,)) else value
+
+
+def date_isoformat(value: Any) -> Any:
+    """일시의 날짜 부분만 ISO 형식 문자열로 바꾼다"""
+    return value.date().isoformat() if isinstance(value, dt.datetime) else isoformat(value)
+
+
+class Serializer:
+    """모델 객체를 dict 로 바꾼다
+
+    rename: 속성 이름 -> 결과 키, exclude: 뺄 속성, convert: 결과 키 -> 변환 함수(값이 None 이면 부르지 않는다).
+    클래스 본문에 두면 그 클래스를 대상으로 한다.
+    바로 JSON 응답으로 보낼 때는 native 로 날짜/시간 변환(isoformat)을 건너뛰고 JSON 인코더에 맡긴다.
+    `only` 로 일부 키만 내보내는 직렬화기를, `project` 로 그 키에 필요한 컬럼만 읽는 쿼리를 만든다.
+    """
+    SUBSET_CACHE_SIZE = 64
+
+    def __init__(
+        self,
+        model: Optional[type] = None,
+        rename: Optional[Dict[str, str]] = None,
+        exclude: Iterable[str] = (),
+        convert: Optional[Dict[str, Callable[[Any], Any]]] = None,
+    ):
+        self.model = model
+        self.rename = dict(rename or {})
+        self.exclude = frozenset(exclude)
+        self.convert = dict(convert or {})
+        self._compiled: Optional[Tuple[Tuple[str, ...], Callable, Tuple[Tuple[str, Callable], ...]]] = None
+        self._native_converters: Tuple[Tuple[str, Callable], ...] = ()
+        self._attrs: Tuple[str, ...] = ()
+        self._subsets: Dict[FrozenSet[str], "Serializer"] = {}
+
+    def __set_name__(self, owner, name):
+        if self.model is None:
+            self.model = owner
+
+    def _compile(self) -> Tuple[Tuple[str, ...], Callable, Tuple[Tuple[str, Callable], ...]]:
+        if self._compiled is None:
+            attrs = [key for key in self.model.__mapper__.c.keys() if not key.startswith("_")]
+            attrs += [
+                key for key, prop in inspect(self.model).all_orm_descriptors.items()
+                if isinstance(prop, hybrid_property)
+            ]
+            attrs = [key for key in attrs if key not in self.exclude]
+
+            keys = tuple(self.rename.get(key, key) for key in attrs)
+            if not attrs:
+                getter = lambda obj: ()  # noqa: E731
+            elif len(attrs) == 1:
+                getter = (lambda get: lambda obj: (get(obj),))(attrgetter(*attrs))
+            else:
+                getter = attrgetter(*attrs)
+            converters = tuple((key, func,) for key, func in self.convert.items() if key in keys)
+            self._native_converters = tuple((key, func,) for key, func in converters if func is not isoformat)
+            self._attrs = tuple(attrs)
+            self._compiled = keys, getter, converters
+        return self._compiled
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        return self._compile()[0]
+
+    def only(self, keys: Optional[Iterable[str]]) -> "Serializer":
+        """결과 키를 keys 로 제한한 직렬화기(없는 키는 무시하고, None 이면 자신을 반환한다)"""
+        if keys is None:
+            return self
+
+        all_keys = self.keys
+        keys = frozenset(keys).intersection(all_keys)
+        serializer = self._subsets.get(keys)
+        if serializer is None:
+            exclude = self.exclude.union(attr for attr, key in zip(self._attrs, all_keys) if key not in keys)
+            serializer = Serializer(self.model, self.rename, exclude, self.convert)
+            if len(self._subsets) < self.SUBSET_CACHE_SIZE:
+                self._subsets[keys] = serializer
+        return serializer
+
+    def project(self, query):
+        """내보낼 컬럼만 SELECT 하도록 쿼리를 바꾼다(하이브리드 속성처럼 어떤 컬럼을 쓰는지 모르면 그대로 둔다)"""
+        self._compile()
+        columns = set(self.model.__mapper__.c.keys())
+        if not self._attrs or not columns.issuperset(self._attrs):
+            return query
+        return query.with_entities(*(getattr(self.model, attr) for attr in self._attrs))
+
+    def dump(self, obj, native: bool = False) -> dict:
+        return self.dump_many((obj,), native)[0]
+
+    def dump_many(self, objs: Iterable, native: bool = False) -> List[dict]:
+        keys, getter, converters = self._compile()
+        if native:
+            converters = self._native_converters
+        result = []
+        append = result.append
+        for obj in objs:
+            dict_ = dict(zip(keys, getter(obj)))
+            for key, func in converters:
+                value = dict_[key]
+                if value is not None:
+                    dict_[key] = func(value)
+            append(dict_)
+        return result
+
+
+_serializers: Dict[type, Serializer] = {}
+
+
+def get_serializer(model: type) -> Serializer:
+    """변환 없이 모든 필드를 내보내는 기본 직렬화기"""
+    serializer = _serializers.get(model)
+    if serializer is None:
+        serializer = _serializers.setdefault(model, Serializer(model))
+    return serializer
+
+
+class Fields(NamedTuple):
+    """요청한 필드(`fields=book_id,room.name,user`)
+
+    own: 이 객체의 키(하위 객체 이름만 적으면 하위 객체 전체), nested: 하위 객체 이름 -> 하위 객체에서 요청한 필드
+    """
+    own: FrozenSet[str]
+    nested: Dict[str, str]
+
+    def includes(self, name: str) -> bool:
+        return name in self.own or name in self.nested
+
+    def sub(self, name: str) -> Optional["Fields"]:
+        """하위 객체에서 요청한 필드(전체면 None)"""
+        if name in self.own or name not in self.nested:
+            return None
+        return parse_fields(self.nested[name])
+
+
+def parse_fields(value: Optional[str]) -> Optional[Fields]:
+    """`fields` 값을 해석한다(없으면 None, 모든 필드)"""
+    if not value:
+        return None
+
+    own = set()
+    nested: Dict[str, List[str]] = {}
+    for field in filter(None, (field.strip() for field in value.split(","))):
+        name, _, sub = field.partition(".")
+        if sub:
+            nested.setdefault(name, []).append(sub)
+        else:
+            own.add(name)
+    return Fields(frozenset(own), {name: ",".join(subs) for name, subs in nested.items()})
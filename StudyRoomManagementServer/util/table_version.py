@@ -0,0 +1,148 @@
+"""테이블 버전과 ETag
+
+`versioned_etag` 를 붙인 GET 은 읽는 테이블(과 설정)의 버전으로 ETag 를 만들고,
+클라이언트의 If-None-Match 와 같으면 본문을 만들지 않고 304 를 보낸다.
+버전은 `TABLE_VERSION_PATH/{테이블}` 파일로 공유하므로 다른 워커에서의 변경도 바로 반영된다.
+커밋된 ORM 변경(flush, bulk UPDATE/DELETE/INSERT)과 설정 저장(`Config.save`) 때 버전을 올린다.
+설정은 워커마다 읽어 두므로 `get_config` 에서 버전이 바뀌었으면 다시 읽는다.
+"""
+import functools
+import hashlib
+import os
+import threading
+import uuid
+from typing import Callable, Iterable, Optional, Set, Tuple, Union
+
+from flask import Flask, Response, make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from StudyRoomManagementServer.__version__ import __version__
+
+CONFIG = "config"
+
+VERSION_PATH: str = ""
+
+_watched: Set[str] = {CONFIG}
+_SESSION_KEY = "changed_tables"
+
+
+def _get_name(table: Union[str, type]) -> str:
+    return table if isinstance(table, str) else table.__tablename__
+
+
+def _get_version_path(name: str) -> str:
+    return os.path.join(VERSION_PATH, name)
+
+
+def get_version(name: str) -> str:
+    """테이블 버전(바뀐 적이 없으면 "0")"""
+    try:
+        stat = os.stat(_get_version_path(name))
+    except OSError:
+        return "0"
+    return f"{stat.st_ino:x}.{stat.st_mtime_ns:x}"
+
+
+def bump(name: str) -> None:
+    """테이블 버전을 올린다(ETag 에서 쓰지 않는 테이블은 무시)"""
+    if name not in _watched or not VERSION_PATH:
+        return
+
+    version_path = _get_version_path(name)
+    temp_path = f"{version_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(temp_path, version_path)
+    except OSError as e:
+        print(e)
+
+
+def watch(*tables: Union[str, type]) -> Tuple[str, ...]:
+    """tables(모델 또는 이름)의 버전을 관리한다"""
+    names = tuple(_get_name(table) for table in tables)
+    _watched.update(names)
+    return names
+
+
+def _changed_tables(session: Session) -> Set[str]:
+    return session.info.setdefault(_SESSION_KEY, set())
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, _flush_context) -> None:
+    tables = _changed_tables(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            tables.add(table.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _do_orm_execute(orm_execute_state) -> None:
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None:
+        _changed_tables(orm_execute_state.session).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    for name in session.info.pop(_SESSION_KEY, ()):
+        bump(name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _set_cache_headers(response: Response, etag: str, vary: Optional[str]) -> Response:
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    if vary:
+        response.vary.add(vary)
+    return response
+
+
+def get_etag(tables: Iterable[str], extra: str = "") -> str:
+    key = "|".join((
+        __version__,
+        request.full_path,
+        extra,
+        *(f"{name}={get_version(name)}" for name in tables),
+    ))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def versioned_etag(
+        *tables: Union[str, type], extra: Optional[Callable[[], str]] = None, vary: Optional[str] = None
+):
+    """tables(모델 또는 이름, 설정은 CONFIG)의 버전과 요청 주소로 ETag 를 붙인다
+
+    응답이 요청 주소와 테이블 말고 다른 것(쿠키 등)에 따라 달라지면 extra 로 그 값을, vary 로 그 헤더 이름을 넘긴다.
+    인증 데코레이터보다 안쪽(아래)에 붙여야 인증 전에 304 를 보내지 않는다.
+    """
+    names = watch(*tables)
+
+    def wrapper(func):
+        @functools.wraps(func)
+        def inner_wrapper(*args, **kwargs):
+            etag = get_etag(names, extra() if extra else "")
+            if request.if_none_match.contains(etag):
+                return _set_cache_headers(Response(status=304), etag, vary)
+
+            response = make_response(func(*args, **kwargs))
+            if response.status_code == 200:
+                _set_cache_headers(response, etag, vary)
+            return response
+        return inner_wrapper
+    return wrapper
+
+
+def init_app(app: Flask):
+    global VERSION_PATH
+    VERSION_PATH = app.config.get("TABLE_VERSION_PATH", os.path.join(app.instance_path, "table_version"))
+    os.makedirs(VERSION_PATH, exist_ok=True)
@@ -1,29 +1,56 @@
-import gc
+import datetime as dt
+import hashlib
 import io
 import os
-from contextlib import contextmanager
-from typing import List
+import threading
+from glob import glob
+from typing import List, Dict, NamedTuple, Optional, Tuple
 
 import matplotlib
+import matplotlib.axes
 import matplotlib.figure
 import matplotlib.font_manager as fm
 import matplotlib.pyplot as plt
+from PIL import Image
 from flask import Flask
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 from StudyRoomManagementServer import model
 from StudyRoomManagementServer.cms_config import get_config
+from StudyRoomManagementServer.util import table_version
+from StudyRoomManagementServer.util.image_variant import remove_variants
 
 matplotlib.use('agg')
 
 # rooms: List[str] = []
 colors = ['pink', 'lightgreen', 'lightblue', 'wheat', 'salmon']
 
+FIGURE_SIZE = (16, 8.85)
+FIGURE_DPI = 200
+LAYOUT_VERSION = 1
+
+CACHE_PATH: str = ""
+
+
+class _RoomData(NamedTuple):
+    """배경에 그려진 방 정보"""
+    id: int
+    name: str
+    type: int
+    no: int
 
-def figure_to_image(fig: plt.Figure) -> io.BytesIO:
-    buf = io.BytesIO()
-    fig.savefig(buf, dpi=200)
-    buf.seek(0)
-    return buf
+
+class _Background(NamedTuple):
+    """미리 그려둔 시간표 배경"""
+    key: Tuple[str, dt.time, dt.time]
+    fig: matplotlib.figure.Figure
+    ax: matplotlib.axes.Axes
+    region: object
+    rooms: Dict[int, _RoomData]
+
+
+_background: Optional[_Background] = None
+_background_lock = threading.Lock()
 
 
 def _get_room_no(room: model.Room) -> int:
@@ -62,24 +89,34 @@ def _get_color(book: model.RoomBook) -> str:
     return color
 
 
-@contextmanager
-def figure() -> matplotlib.figure.Figure:
+table_version.watch(model.Room)
+
+
+def _background_key() -> Tuple[str, dt.time, dt.time]:
+    """배경 버전: (방 테이블 버전, 시작 시간, 종료 시간)
+
+    방 테이블 버전은 워커끼리 공유하므로 다른 워커에서 방을 바꿔도 배경을 다시 그린다.
+    """
+    config = get_config()
+    weekdays_open, weekend_open = config.book_room_weekdays_open, config.book_room_weekend_open
+    weekdays_close, weekend_close = config.book_room_weekdays_close, config.book_room_weekend_close
+
+    start_time = weekdays_open if weekdays_open < weekend_open else weekend_open
+    end_time = weekdays_close if weekdays_close > weekend_close else weekend_close
+    return table_version.get_version(model.Room.__tablename__), start_time, end_time
+
+
+def _create_background(key: Tuple[str, dt.time, dt.time]) -> _Background:
+    """축, 눈금, 격자까지 그린 배경을 생성한다"""
+    _, start_time, end_time = key
     room_l: List[model.Room] = model.Room.query.all()
     rooms: List[str] = [room.name for room in room_l]
-    if get_config().book_room_weekdays_open < get_config().book_room_weekend_open:
-        start_time = get_config().book_room_weekdays_open
-    else:
-        start_time = get_config().book_room_weekend_open
-
-    if get_config().book_room_weekdays_close > get_config().book_room_weekend_close:
-        end_time = get_config().book_room_weekdays_close
-    else:
-        end_time = get_config().book_room_weekend_close
 
     start_point = (start_time.hour + start_time.minute // 60) - 0.1
     end_point = (end_time.hour + end_time.minute // 60) + 0.1
 
-    fig: matplotlib.figure.Figure = plt.figure(figsize=(16, 8.85), clear=True)
+    fig = matplotlib.figure.Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+    FigureCanvasAgg(fig)
 
     # Set Axis
     ax = fig.add_subplot(111, alpha=0.5)
@@ -99,67 +136,160 @@ def figure() -> matplotlib.figure.Figure:
     ax2.set_xticklabels(rooms)
     ax2.set_ylabel('시간')
 
-    try:
-        yield fig
-    finally:
-        try:
-            fig.clf()
-            plt.close(fig)
-            plt.close("all")
-            plt.clf()
-            del fig
-            gc.collect()
-            # pass
-        except:
-            pass
+    fig.canvas.draw()
+    region = fig.canvas.copy_from_bbox(fig.bbox)
+
+    return _Background(
+        key=key,
+        fig=fig,
+        ax=ax2,
+        region=region,
+        rooms={room.id: _RoomData(room.id, room.name, room.type, room.no) for room in room_l},
+    )
+
+
+def _get_background() -> _Background:
+    """현재 방 정보와 운영 시간에 맞는 배경을 가져온다(_background_lock 안에서 호출)"""
+    global _background
+    key = _background_key()
+    if _background is None or _background.key != key:
+        _background = _create_background(key)
+    return _background
+
+
+def _get_usernames(books: List[model.RoomBook]) -> Dict[int, str]:
+    user_ids = {book.user_id for book in books}
+    if not user_ids:
+        return {}
+    return dict(
+        model.User.query.filter(model.User.id.in_(user_ids)).with_entities(model.User.id, model.User.username).all()
+    )
 
 
 def create_timetable(title: str, books: List[model.RoomBook], with_text: bool = True) -> io.BytesIO:
-    with figure() as fig:
-        for book in books:
-            room = model.Room.query.filter_by(id=book.room_id).first()
-            room_no = _get_room_no(room) - 0.5  # x 축 정렬
-            color = _get_color(book)
-            if not (book.status == 200 or book.status == 400):
-                continue
-
-            start = book.start_time_second / 60
-            end = book.end_time_second / 60
-
-            # plot event
-            plt.fill_between(
-                [room_no, room_no+0.96],
-                [start, start],
-                [end, end],
-                color=color,
-                edgecolor='k',
-                linewidth=0.5)
-
-            # plot beginning time
-            plt.text(
-                x=room_no+0.02,
-                y=start+0.05,
-                s=f'{int(start)}: {book.start_time_second % 60:0>2}\n - {int(end)}: {book.end_time_second % 60:0>2}',
-                va='top',
-                fontsize=7)
-
-            if with_text:
-                username = model.User.query.filter_by(id=book.user_id).first().username
-                department = book.department if book.department is not None else "기타"
-
-                # plot event name
-                plt.text(
-                    room_no+0.48,
-                    (start+end)*0.5,
-                    f"[{department:3.3}]\n{username}\n{book.people_no}명 {room.no}",
-                    ha='left',
-                    va='center', fontsize=9)
-
-        plt.title(title, y=1.07)
-        return figure_to_image(fig)
+    usernames = _get_usernames(books) if with_text else {}
+
+    with _background_lock:
+        background = _get_background()
+        ax = background.ax
+        background.fig.canvas.restore_region(background.region)
+
+        artists = []
+        try:
+            for book in books:
+                room = background.rooms.get(book.room_id)
+                if room is None:
+                    room = model.Room.query.filter_by(id=book.room_id).first()
+                room_no = _get_room_no(room) - 0.5  # x 축 정렬
+                color = _get_color(book)
+                if not (book.status == 200 or book.status == 400):
+                    continue
+
+                start = book.start_time_second / 60
+                end = book.end_time_second / 60
+
+                # plot event
+                artists.append(ax.fill_between(
+                    [room_no, room_no+0.96],
+                    [start, start],
+                    [end, end],
+                    color=color,
+                    edgecolor='k',
+                    linewidth=0.5))
+
+                # plot beginning time
+                artists.append(ax.text(
+                    x=room_no+0.02,
+                    y=start+0.05,
+                    s=f'{int(start)}: {book.start_time_second % 60:0>2}\n - {int(end)}: {book.end_time_second % 60:0>2}',
+                    va='top',
+                    fontsize=7))
+
+                if with_text:
+                    username = usernames.get(book.user_id)
+                    department = book.department if book.department is not None else "기타"
+
+                    # plot event name
+                    artists.append(ax.text(
+                        room_no+0.48,
+                        (start+end)*0.5,
+                        f"[{department:3.3}]\n{username}\n{book.people_no}명 {room.no}",
+                        ha='left',
+                        va='center', fontsize=9))
+
+            ax.set_title(title, y=1.07)
+            for artist in artists:
+                ax.draw_artist(artist)
+            ax.draw_artist(ax.title)
+
+            width, height = background.fig.canvas.get_width_height()
+            img = Image.frombuffer(
+                "RGBA", (width, height), bytes(background.fig.canvas.buffer_rgba()), "raw", "RGBA", 0, 1
+            )
+        finally:
+            for artist in artists:
+                artist.remove()
+            ax.set_title("")
+
+    buf = io.BytesIO()
+    img.save(buf, "PNG", dpi=(FIGURE_DPI, FIGURE_DPI))
+    buf.seek(0)
+    return buf
+
+
+def get_timetable_hash(title: str, books: List[model.RoomBook], with_text: bool = True) -> str:
+    """시간표 이미지를 결정하는 값(배경, 제목, 예약, 이름)의 해시"""
+    with _background_lock:
+        background = _get_background()
+    usernames = _get_usernames(books) if with_text else {}
+
+    key = (
+        LAYOUT_VERSION,
+        background.key[1:],
+        sorted(background.rooms.values()),
+        title,
+        bool(with_text),
+        sorted(
+            (book.room_id, book.status, book.purpose, book.start_time_second, book.end_time_second,
+             book.user_id, book.department, book.people_no,)
+            for book in books
+        ),
+        sorted(usernames.items()),
+    )
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+
+
+def get_timetable_path(title: str, books: List[model.RoomBook], with_text: bool = True) -> Tuple[str, str]:
+    """캐시된 시간표 이미지 경로와 해시를 반환한다(없으면 생성)
+
+    파일 이름은 `{제목}-{이름 표시}-{해시}.png` 이므로 예약이 바뀌지 않았으면 다시 그리지 않는다.
+    """
+    image_hash = get_timetable_hash(title, books, with_text)
+    prefix = f"{title}-{int(bool(with_text))}"
+    file_path = os.path.join(CACHE_PATH, f"{prefix}-{image_hash}.png")
+    if os.path.isfile(file_path):
+        return file_path, image_hash
+
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(create_timetable(title, books, with_text).getbuffer())
+    os.replace(temp_path, file_path)
+
+    for old_path in glob(os.path.join(CACHE_PATH, f"{prefix}-*.png")):
+        if old_path != file_path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+            remove_variants(old_path)
+    return file_path, image_hash
 
 
 def init_app(app: Flask):
     fm.fontManager.addfont(os.path.join(app.root_path, "static", "font", "NanumGothic.ttf"))
     font = fm.FontProperties(fname=os.path.join(app.root_path, "static", "font", "NanumGothic.ttf"))
     plt.rc('font', family=font.get_name())
+
+    global CACHE_PATH
+    CACHE_PATH = app.config.get("TIMETABLE_CACHE_PATH", os.path.join(app.instance_path, "timetable"))
+    os.makedirs(CACHE_PATH, exist_ok=True)
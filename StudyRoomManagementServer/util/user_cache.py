@@ -0,0 +1,110 @@
+"""사용자 조회 캐시
+
+id, chat_id 로 읽은 사용자 정보를 USER_CACHE_TTL 초 동안 프로세스 안에 보관한다.
+이 프로세스에서 사용자가 추가/수정/삭제되면 바로 지우고, 다른 워커에서의 변경은 최대 USER_CACHE_TTL 초 늦게 반영된다.
+"""
+import time
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+from StudyRoomManagementServer.model import User, db
+
+USER_CACHE_TTL = 5
+
+
+class _UserCacheEntry(NamedTuple):
+    """사용자 정보(컬럼 값)"""
+    expire: float
+    user: dict
+
+
+_users: Dict[int, _UserCacheEntry] = {}
+_chat_ids: Dict[int, int] = {}
+
+
+def _invalidate_user(_mapper, _connection, target: User) -> None:
+    entry = _users.pop(target.id, None)
+    if entry is not None:
+        _chat_ids.pop(entry.user["chat_id"], None)
+    _chat_ids.pop(target.chat_id, None)
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(User, _event_name, _invalidate_user)
+
+
+def _store(user: User) -> None:
+    snapshot = {key: getattr(user, key) for key in User.__mapper__.c.keys()}
+    _users[user.id] = _UserCacheEntry(time.monotonic() + USER_CACHE_TTL, snapshot)
+    if user.chat_id is not None:
+        _chat_ids[user.chat_id] = user.id
+
+
+def _attach(snapshot: dict) -> User:
+    """캐시된 값으로 세션에 속한 사용자를 만든다(세션에 이미 있으면 그것을 사용)"""
+    user = db.session.identity_map.get(identity_key(User, snapshot["id"]))
+    if user is not None:
+        return user
+
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def get_user(user_id: int) -> Optional[User]:
+    """id 로 사용자를 읽는다(캐시에 없거나 만료되면 DB 에서 읽는다)"""
+    entry = _users.get(user_id)
+    if entry is not None and entry.expire > time.monotonic():
+        return _attach(entry.user)
+
+    user = User.query.filter_by(id=user_id).first()
+    if user is not None:
+        _store(user)
+    return user
+
+
+def get_users(user_ids: Iterable[int]) -> Dict[int, User]:
+    """여러 사용자를 읽는다(캐시에 없거나 만료된 사용자만 한번에 DB 에서 읽는다)"""
+    users = {}
+    missing = []
+    now = time.monotonic()
+    for user_id in set(user_ids):
+        entry = _users.get(user_id)
+        if entry is not None and entry.expire > now:
+            users[user_id] = _attach(entry.user)
+        else:
+            missing.append(user_id)
+
+    if missing:
+        for user in User.query.filter(User.id.in_(missing)).all():
+            _store(user)
+            users[user.id] = user
+    return users
+
+
+def get_stale_user(user_id: int) -> Optional[User]:
+    """DB 를 읽을 수 없을 때 쓰는 마지막으로 읽은 사용자 정보(만료되어도 반환하며 세션에 속하지 않는다)"""
+    entry = _users.get(user_id)
+    return User(**entry.user) if entry is not None else None
+
+
+def get_user_by_chat_id(chat_id: int) -> Optional[User]:
+    """chat_id 로 사용자를 읽는다(캐시에 없거나 만료되면 DB 에서 읽는다)"""
+    user_id = _chat_ids.get(chat_id)
+    entry = _users.get(user_id) if user_id is not None else None
+    if entry is not None and entry.expire > time.monotonic() and entry.user["chat_id"] == chat_id:
+        return _attach(entry.user)
+
+    user = User.query.filter_by(chat_id=chat_id).first()
+    if user is not None:
+        _store(user)
+    return user
+
+
+def init_app(app: Flask):
+    global USER_CACHE_TTL
+    USER_CACHE_TTL = app.config.get("USER_CACHE_TTL", USER_CACHE_TTL)
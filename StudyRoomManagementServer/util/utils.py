@@ -111,3 +111,118 @@ def verify(request_data):
     return hmac.new(
         secret_key, msg=data_check_string.encode(), digestmod=hashlib.sha256
     ).hexdigest()
+
+
+import io
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+
+class _StreamBuffer(io.RawIOBase):
+    """ZipFile 이 쓴 내용을 모아 두었다가 꺼내주는 버퍼"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files: Iterable[Tuple[str, str]]) -> Iterator[bytes]:
+    """(압축 파일 내 이름, 파일 경로) 목록을 ZIP 으로 묶어 조각 단위로 반환한다"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        for arcname, file_path in files:
+            zf.write(file_path, arcname)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+import os
+from flask import Response, request, send_file
+
+
+def send_spool_file(
+        file_path: str,
+        mimetype: str,
+        etag: Optional[str] = None,
+        cache_control: str = "no-cache",
+        download_name: Optional[str] = None,
+) -> Response:
+    """디스크에 만들어 둔 파일을 보낸다
+
+    `SPOOL_ACCEL_REDIRECT` 가 설정되어 있고 파일이 instance 폴더 안에 있으면 본문 없이 `X-Accel-Redirect` 로 nginx 에 넘긴다.
+    아니면 send_file 로 보낸다(wsgi.file_wrapper 를 지원하는 서버는 sendfile 로 보낸다).
+    """
+    accel_prefix = current_app.config.get("SPOOL_ACCEL_REDIRECT")
+    rel_path = os.path.relpath(file_path, current_app.instance_path)
+
+    if accel_prefix and not rel_path.startswith(os.pardir):
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = f"{accel_prefix.rstrip('/')}/{rel_path.replace(os.sep, '/')}"
+        if download_name:
+            response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+        if etag:
+            response.set_etag(etag)
+            response.make_conditional(request)
+    else:
+        response = send_file(
+            file_path,
+            mimetype=mimetype,
+            etag=etag or True,
+            as_attachment=download_name is not None,
+            download_name=download_name,
+        )
+
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+from flask import stream_with_context
+
+from .serializer import Fields, Serializer, parse_fields
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+NDJSON_BATCH = 500
+
+
+def want_ndjson() -> bool:
+    """`?format=ndjson` 으로 한 줄에 하나씩 보내 달라고 요청했는가?"""
+    return request.args.get("format", type=str) == "ndjson"
+
+
+def stream_ndjson(query, serializer: Serializer, batch_size: int = NDJSON_BATCH) -> Response:
+    """쿼리 결과를 batch_size 개씩 읽어(yield_per) 한 줄에 하나씩 JSON 으로 보낸다(전체를 메모리에 올리지 않는다)"""
+    def generate() -> Iterator[str]:
+        dumps = current_app.json.dumps
+        rows = []
+        for obj in query.yield_per(batch_size):
+            rows.append(obj)
+            if len(rows) >= batch_size:
+                yield "".join(dumps(row) + "\n" for row in serializer.dump_many(rows, native=True))
+                rows = []
+        if rows:
+            yield "".join(dumps(row) + "\n" for row in serializer.dump_many(rows, native=True))
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def get_request_fields() -> Optional[Fields]:
+    """`?fields=` 로 요청한 필드(없으면 None, 모든 필드)"""
+    return parse_fields(request.args.get("fields", type=str))
+
+
+def get_request_serializer(serializer: Serializer) -> Serializer:
+    """`?fields=` 로 요청한 키만 내보내는 직렬화기"""
+    fields = get_request_fields()
+    return serializer.only(fields.own if fields is not None else None)
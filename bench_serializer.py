@@ -0,0 +1,107 @@
+"""직렬화 성능 비교
+
+기존 방식(객체마다 컬럼/하이브리드 속성을 살펴보는 publics_to_dict)과 모델별 Serializer 의 행당 시간을 비교한다.
+DB 없이 메모리의 객체로만 측정한다.
+
+    python bench_serializer.py [행 수]
+"""
+import datetime as dt
+import sys
+import timeit
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.hybrid import hybrid_property
+
+from StudyRoomManagementServer.model import RoomBook, User, Transaction
+
+
+def legacy_to_dict(obj) -> dict:
+    dict_ = {}
+    for key in obj.__mapper__.c.keys():
+        if not key.startswith("_"):
+            dict_[key] = getattr(obj, key)
+
+    for key, prop in inspect(obj.__class__).all_orm_descriptors.items():
+        if isinstance(prop, hybrid_property):
+            dict_[key] = getattr(obj, key)
+    return dict_
+
+
+def legacy_room_book(obj: RoomBook) -> dict:
+    dict_ = legacy_to_dict(obj)
+    dict_["book_id"] = dict_["id"]
+    dict_["book_date"] = dict_["book_date"].date().isoformat()
+    for key in ("start_time", "end_time",):
+        second = 1439 if dict_[f"{key}_second"] == 1440 else dict_[f"{key}_second"]
+        dict_[key] = dt.time(hour=int(second / 60), minute=int(second % 60)).isoformat()
+        del dict_[f"{key}_second"]
+    dict_["created"] = dict_["created"].isoformat()
+    dict_["modified"] = dict_["modified"].isoformat()
+    del dict_["id"]
+    return dict_
+
+
+def legacy_user(obj: User) -> dict:
+    dict_ = legacy_to_dict(obj)
+    dict_["created"] = dict_["created"].isoformat()
+    dict_["modified"] = dict_["modified"].isoformat()
+    dict_["user_id"] = dict_["id"]
+    del dict_["encrypted_num"]
+    del dict_["num_index"]
+    del dict_["num"]
+    del dict_["id"]
+    return dict_
+
+
+def legacy_transaction(obj: Transaction) -> dict:
+    dict_ = legacy_to_dict(obj)
+    dict_["transaction_id"] = dict_["id"]
+    dict_["created"] = dict_["created"].isoformat()
+    del dict_["id"]
+    return dict_
+
+
+def make_rows(count: int):
+    now = dt.datetime(2024, 1, 1, 9, 0)
+    room_books = [
+        RoomBook(
+            id=i, room_id=1, user_id=i, status=200, people_no=4, book_date=now, start_time_second=600,
+            end_time_second=720, department="dep", purpose="study", obj="", created=now, modified=now,
+        )
+        for i in range(count)
+    ]
+    users = [
+        User(
+            id=i, chat_id=i, tg_name="tg", username="user", birthday="000101", age=20, gender=1, status=0, grade=1,
+            department="dep", sms=1, created=now, modified=now,
+        )
+        for i in range(count)
+    ]
+    transactions = [
+        Transaction(id=i, user_id=i, pay_id=i, client_name="client", type=100, money=10000, tax=909, created=now)
+        for i in range(count)
+    ]
+    return room_books, users, transactions
+
+
+def main(count: int):
+    room_books, users, transactions = make_rows(count)
+    cases = (
+        ("RoomBook", room_books, legacy_room_book, RoomBook.serializer,),
+        ("User", users, legacy_user, User.serializer,),
+        ("Transaction", transactions, legacy_transaction, Transaction.serializer,),
+    )
+
+    print(f"{'model':<12} {'legacy us/row':>14} {'serializer us/row':>18} {'speedup':>8}")
+    for name, rows, legacy, serializer in cases:
+        assert [legacy(row) for row in rows[:1]] == serializer.dump_many(rows[:1])
+        legacy_time = min(timeit.repeat(lambda: [legacy(row) for row in rows], number=1, repeat=5))
+        serializer_time = min(timeit.repeat(lambda: serializer.dump_many(rows), number=1, repeat=5))
+        print(
+            f"{name:<12} {legacy_time / count * 1e6:>14.2f} {serializer_time / count * 1e6:>18.2f} "
+            f"{legacy_time / serializer_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)